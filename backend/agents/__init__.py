@@ -1,13 +1,19 @@
 from agents.base_agents import (
     AgentState,
+    new_agent_state,
     router_agent,
     finance_agent,
     housing_agent,
     visa_agent,
     rag_agent,
+    run_domain_agents,
+    run_review_agents,
     risk_agent,
     get_context_for_agent,
-    call_gemini_with_reasoning
+    get_contexts_for_agents,
+    call_gemini_with_reasoning,
+    call_gemini_with_reasoning_stream,
+    call_gemini_batch
 )
 
 from agents.specialized_agents import (
@@ -19,16 +25,22 @@ from agents.graph import build_graph, run_analysis_workflow
 
 __all__ = [
     "AgentState",
+    "new_agent_state",
     "router_agent",
     "finance_agent",
     "housing_agent",
     "visa_agent",
     "rag_agent",
+    "run_domain_agents",
+    "run_review_agents",
     "risk_agent",
     "translation_agent",
     "scenario_agent",
     "get_context_for_agent",
+    "get_contexts_for_agents",
     "call_gemini_with_reasoning",
+    "call_gemini_with_reasoning_stream",
+    "call_gemini_batch",
     "build_graph",
     "run_analysis_workflow"
 ]
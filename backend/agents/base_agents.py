@@ -1,19 +1,62 @@
+import asyncio
+import functools
+import hashlib
+import itertools
 import logging
-from typing import TypedDict, Optional, List, Dict, Any
+import re
+from typing import TypedDict, Optional, List, Dict, Any, Tuple, AsyncIterator, Pattern
 import google.generativeai as genai
-from config import GEMINI_API_KEY, GEMINI_MODEL
-from tools.retrieval_tool import GlobalRetrievalTool
+import numpy as np
+from config import (
+    GEMINI_API_KEY,
+    GEMINI_MODEL,
+    PROMPT_DOCUMENT_TOKENS,
+    ROUTER_EMBEDDING_CHARS,
+    ROUTER_EMBEDDING_MIN_SIMILARITY,
+    ROUTER_EMBEDDING_MIN_MARGIN,
+    MIN_DOCUMENT_CHARS,
+    MAX_STATE_OBLIGATIONS,
+    MAX_STATE_CLAUSES,
+    MAX_STATE_RED_FLAGS,
+    DOMAIN_SLICE_CHARS,
+    DOMAIN_SLICE_WINDOW_CHARS,
+    RETRIEVAL_CACHE_MAX_ENTRIES,
+    RETRIEVAL_CACHE_TTL_SECONDS,
+    AGENT_TIMEOUT_SECONDS,
+    PROMPT_CACHE_MAX_ENTRIES,
+    PROMPT_CACHE_TTL_SECONDS
+)
+from db.vector_store import embed_text, embed_texts, get_write_epoch
+from tools.retrieval_tool import GlobalRetrievalTool, GlobalRetrievalToolBatch, GlobalRetrievalToolMulti
+from tools.ttl_cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
 # Configure Gemini
 genai.configure(api_key=GEMINI_API_KEY)
 
+# Exact-match Gemini responses keyed by a hash of model, namespace, temperature and prompt.
+# Prompts carry document text, so only identical prompts may share an answer: similar
+# documents (e.g. two leases from one template) must never get each other's analysis
+_prompt_cache = TTLCache(
+    max_entries=PROMPT_CACHE_MAX_ENTRIES,
+    ttl_seconds=PROMPT_CACHE_TTL_SECONDS
+)
+
+# Agent retrieval results keyed by (kind, query, domain, top_k, write epoch of that domain);
+# formatted context strings for the domain agents, result tuples for the RAG agent
+_context_cache = TTLCache(
+    max_entries=RETRIEVAL_CACHE_MAX_ENTRIES,
+    ttl_seconds=RETRIEVAL_CACHE_TTL_SECONDS
+)
+
 
 class AgentState(TypedDict):
     """Shared state dictionary for the agent workflow."""
     session_id: str
     raw_text: str
+    raw_text_truncated: Optional[str]
+    domain_slices: Dict[str, str]
     domain: str
     language: str
     clauses: List[str]
@@ -29,6 +72,112 @@ class AgentState(TypedDict):
     error: Optional[str]
 
 
+def new_agent_state(session_id: str, raw_text: str = "", **fields: Any) -> AgentState:
+    """
+    Build a fully populated AgentState with defaults for every field.
+    Unknown field names raise TypeError instead of silently riding along.
+    """
+    unknown = fields.keys() - AgentState.__annotations__.keys()
+    if unknown:
+        raise TypeError(f"Unknown AgentState fields: {', '.join(sorted(unknown))}")
+    
+    state = AgentState(
+        session_id=session_id,
+        raw_text=raw_text,
+        raw_text_truncated=None,
+        domain_slices={},
+        domain="",
+        language="en",
+        clauses=[],
+        obligations=[],
+        financial_details=None,
+        housing_details=None,
+        visa_details=None,
+        risk_assessment=None,
+        red_flags=[],
+        resources=[],
+        translation=None,
+        scenario=None,
+        error=None
+    )
+    state.update(fields)
+    return state
+
+
+# Word or punctuation pieces used for local token estimates
+_TOKEN_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+_CHARS_PER_TOKEN = 4
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Cut text to roughly max_tokens Gemini tokens, ending on a word boundary.
+    Tokens are estimated locally (one per punctuation mark, one per four
+    characters of a word) so budgeting needs no count_tokens round-trip.
+    """
+    used = 0
+    for piece in _TOKEN_PIECE_RE.finditer(text):
+        used += -(-len(piece.group()) // _CHARS_PER_TOKEN)
+        if used > max_tokens:
+            return text[:piece.start()].rstrip()
+    return text
+
+
+def _extend_capped(items: List[Any], new_items, limit: int) -> None:
+    """
+    Extend a state list in place, keeping only its newest `limit` entries.
+    Behaves like deque(maxlen=limit) but stays a plain list for LangGraph and MongoDB.
+    """
+    items.extend(new_items)
+    del items[:-limit]
+
+
+def _too_short_to_analyze(state: AgentState, agent: str) -> bool:
+    """True (and logged) when the document text is too small to be worth an LLM call."""
+    if len(state["raw_text"].strip()) >= MIN_DOCUMENT_CHARS:
+        return False
+    logger.info("Skipping %s: document has under %d characters of text", agent, MIN_DOCUMENT_CHARS)
+    return True
+
+
+def _document_excerpt(state: AgentState) -> str:
+    """Token-budgeted document excerpt, computed once per workflow and shared by all agents."""
+    excerpt = state.get("raw_text_truncated")
+    if excerpt is None:
+        excerpt = _truncate_to_tokens(state["raw_text"], PROMPT_DOCUMENT_TOKENS)
+        state["raw_text_truncated"] = excerpt
+    return excerpt
+
+
+def _format_context(results: List[Dict[str, Any]]) -> str:
+    """Format retrieved clauses as a bulleted block for agent prompts."""
+    return "\n".join(f"- {c.get('clause_text', '')}" for c in results)
+
+
+# Embeddings of _FIXED_QUERIES, filled once per process
+_fixed_query_cache: Dict[str, List[float]] = {}
+
+
+async def _fixed_query_embeddings(queries: List[str]) -> List[Optional[List[float]]]:
+    """
+    Return stored embeddings for fixed retrieval queries, embedding any
+    not seen yet in one batch. Other queries (and failures) map to None,
+    which lets the retrieval tool embed them itself.
+    """
+    missing = [q for q in dict.fromkeys(queries) if q in _FIXED_QUERIES and q not in _fixed_query_cache]
+    if missing:
+        try:
+            _fixed_query_cache.update(zip(missing, await embed_texts(missing)))
+        except Exception as e:
+            logger.warning("Fixed query embedding failed: %s", e)
+    return [_fixed_query_cache.get(q) for q in queries]
+
+
+async def warm_query_embeddings() -> None:
+    """Embed every fixed retrieval query up front, e.g. at application startup."""
+    await _fixed_query_embeddings(list(_FIXED_QUERIES))
+
+
 async def get_context_for_agent(
     query_text: str,
     domain: str = None,
@@ -37,112 +186,522 @@ async def get_context_for_agent(
     """
     Global retrieval tool accessible to all agents.
     Returns relevant context from vector store and MongoDB.
+    Results are cached until they expire or the vector store is written to.
     """
+    cache_key = ("context", query_text, domain, top_k, get_write_epoch(domain=domain))
+    cached = _context_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
     try:
+        query_embedding, = await _fixed_query_embeddings([query_text])
         context = await GlobalRetrievalTool(
             query_text=query_text,
             domain_filter=domain,
             top_k=top_k,
-            collection_type="clause"
+            collection_type="clause",
+            query_embedding=query_embedding
         )
         
         # Format context for agent consumption
-        context_str = "\n".join([
-            f"- {c.get('clause_text', '')}" for c in context
-        ])
+        context_str = _format_context(context)
+        if not context_str:
+            return "No relevant context found."
         
-        return context_str if context_str else "No relevant context found."
+        _context_cache.put(cache_key, context_str)
+        return context_str
     except Exception as e:
-        logger.error(f"Context retrieval error: {e}")
+        logger.error("Context retrieval error: %s", e)
         return f"[Context retrieval failed: {e}]"
 
 
+async def get_contexts_for_agents(
+    queries: List[Tuple[str, str]],
+    top_k: int = 5
+) -> List[str]:
+    """
+    Retrieve context for several (query_text, domain) pairs at once.
+    Cache misses share one embedding request and search concurrently;
+    contexts are returned in the order the pairs were given.
+    """
+    keys = [("context", query, domain, top_k, get_write_epoch(domain=domain)) for query, domain in queries]
+    contexts = [_context_cache.get(key) for key in keys]
+    missing = [i for i, context in enumerate(contexts) if context is None]
+    if not missing:
+        return contexts
+    
+    try:
+        embeddings = await _fixed_query_embeddings([queries[i][0] for i in missing])
+        results = await GlobalRetrievalToolMulti(
+            [
+                {"query": queries[i][0], "domain": queries[i][1], "embedding": embedding}
+                for i, embedding in zip(missing, embeddings)
+            ],
+            top_k=top_k,
+            collection_type="clause"
+        )
+        
+        for i in missing:
+            query, domain = queries[i]
+            context_str = _format_context(results.get(domain, []))
+            if context_str:
+                _context_cache.put(keys[i], context_str)
+            contexts[i] = context_str or "No relevant context found."
+        return contexts
+    except Exception as e:
+        logger.error("Context retrieval error: %s", e)
+        return [context or f"[Context retrieval failed: {e}]" for context in contexts]
+
+
+async def _retrieve_clauses(queries: List[str], top_k: int = 3) -> List[Tuple[Dict[str, Any], ...]]:
+    """
+    Unfiltered clause searches for several queries, served from the retrieval
+    cache where possible; the misses are fetched together as one batch.
+    """
+    keys = [("clauses", query, None, top_k, get_write_epoch()) for query in queries]
+    results = [_context_cache.get(key) for key in keys]
+    missing = [i for i, found in enumerate(results) if found is None]
+    if not missing:
+        return results
+    
+    missing_queries = [queries[i] for i in missing]
+    fetched = await GlobalRetrievalToolBatch(
+        missing_queries,
+        top_k=top_k,
+        collection_type="clause",
+        query_embeddings=await _fixed_query_embeddings(missing_queries)
+    )
+    for i, found in zip(missing, fetched):
+        results[i] = tuple(found)
+        if found:
+            _context_cache.put(keys[i], results[i])
+    return results
+
+
+@functools.lru_cache(maxsize=16)
+def _get_model(temperature: float, top_p: float, max_tokens: Optional[int] = None) -> genai.GenerativeModel:
+    """Return a shared model instance for the given generation settings."""
+    generation_config = {
+        "temperature": temperature,
+        "top_p": top_p,
+    }
+    if max_tokens:
+        generation_config["max_output_tokens"] = max_tokens
+    return genai.GenerativeModel(GEMINI_MODEL, generation_config=generation_config)
+
+
+def _prompt_key(prompt: str, temperature: float, cache_namespace: str) -> str:
+    return hashlib.sha256(f"{GEMINI_MODEL}|{cache_namespace}|{temperature}|{prompt}".encode()).hexdigest()
+
+
+def _lookup_cached_response(prompt: str, temperature: float, cache_namespace: Optional[str]) -> Optional[str]:
+    """Return the cached response to this exact prompt, or None (always None when caching is off)."""
+    if not cache_namespace:
+        return None
+    return _prompt_cache.get(_prompt_key(prompt, temperature, cache_namespace))
+
+
+def _store_cached_response(prompt: str, cache_namespace: Optional[str], temperature: float, response: str) -> None:
+    if not cache_namespace:
+        return
+    _prompt_cache.put(_prompt_key(prompt, temperature, cache_namespace), response)
+
+
+async def _generate(prompt: str, temperature: float, max_tokens: Optional[int] = None) -> str:
+    """Single Gemini round-trip returning the stripped response text."""
+    model = _get_model(temperature, 0.9, max_tokens)
+    response = await model.generate_content_async(prompt)
+    return response.text.strip()
+
+
+async def call_gemini_with_reasoning_stream(
+    prompt: str,
+    temperature: float = 0.7,
+    max_tokens: Optional[int] = None
+) -> AsyncIterator[str]:
+    """Stream Gemini's response text chunk by chunk as it is generated."""
+    model = _get_model(temperature, 0.9, max_tokens)
+    response = await model.generate_content_async(prompt, stream=True)
+    async for chunk in response:
+        yield chunk.text
+
+
+# Queued by the stream reader in _generate_until once the response has ended
+_STREAM_END = object()
+
+
+async def _generate_until(
+    prompt: str,
+    temperature: float,
+    stop_pattern: Pattern,
+    max_tokens: Optional[int] = None
+) -> str:
+    """
+    Stream a response and stop as soon as stop_pattern matches the accumulated text.
+    
+    The stream is read by a separate task, which is waiting on the next chunk
+    when the match arrives. Cancelling that pending read cancels the gRPC call,
+    so Gemini stops generating; merely closing the iterator would leave the
+    call open and the server streaming the rest of the answer.
+    """
+    chunks: asyncio.Queue = asyncio.Queue()
+    
+    async def _read() -> None:
+        try:
+            async for chunk in call_gemini_with_reasoning_stream(prompt, temperature, max_tokens):
+                chunks.put_nowait(chunk)
+        finally:
+            chunks.put_nowait(_STREAM_END)
+    
+    reader = asyncio.create_task(_read())
+    accumulated = ""
+    try:
+        while True:
+            chunk = await chunks.get()
+            if chunk is _STREAM_END:
+                break
+            accumulated += chunk
+            if stop_pattern.search(accumulated):
+                break
+    finally:
+        reader.cancel()
+        outcome, = await asyncio.gather(reader, return_exceptions=True)
+    
+    if isinstance(outcome, Exception):
+        raise outcome
+    return accumulated.strip()
+
+
 async def call_gemini_with_reasoning(
     prompt: str,
-    temperature: float = 0.7
+    temperature: float = 0.7,
+    cache_namespace: Optional[str] = None,
+    stop_pattern: Optional[Pattern] = None,
+    max_tokens: Optional[int] = None
 ) -> str:
     """
     Call Gemini for open-ended reasoning without JSON rigidity.
     Uses natural language output for better agent reasoning.
+    
+    When cache_namespace is given, a prompt identical to one previously
+    sent under the same namespace and temperature is answered from the
+    prompt cache instead of calling Gemini.
+    
+    When stop_pattern is given, the response is streamed and cut off once
+    the pattern matches, for callers that only need its opening part.
+    
+    max_tokens caps the length of the generated answer.
     """
+    cached = _lookup_cached_response(prompt, temperature, cache_namespace)
+    if cached is not None:
+        return cached
+    
     try:
-        model = genai.GenerativeModel(
-            GEMINI_MODEL,
-            generation_config={
-                "temperature": temperature,
-                "top_p": 0.9,
-            }
-        )
-        response = model.generate_content(prompt)
-        return response.text.strip()
+        if stop_pattern is not None:
+            text = await _generate_until(prompt, temperature, stop_pattern, max_tokens)
+        else:
+            text = await _generate(prompt, temperature, max_tokens)
+        _store_cached_response(prompt, cache_namespace, temperature, text)
+        return text
     except Exception as e:
-        logger.error(f"Gemini call error: {e}")
+        logger.error("Gemini call error: %s", e)
         return f"Error generating response: {e}"
 
 
+# A bulleted or numbered line of at least 11 characters that is not a "Heading:" line
+_BULLET_RE = re.compile(r"^[ \t]*(?:[-*•●◦]|\d+[.)])[ \t]+(.{10,}[^:\s])[ \t\r]*$", re.MULTILINE)
+# Any line over 20 characters that is not a markdown "# Heading"; "Heading:" lines are dropped separately
+_PROSE_LINE_RE = re.compile(r"^[ \t]*(?!#)(\S.{19,}\S)[ \t\r]*$", re.MULTILINE)
+
+
+def _extract_bullets(text: str, limit: int) -> List[str]:
+    """
+    Pull up to `limit` list items out of an LLM response, stopping once the limit is reached.
+    A reply written as prose has no list items, so its substantive non-heading lines are used instead.
+    """
+    bullets = [match.group(1) for match in itertools.islice(_BULLET_RE.finditer(text), limit)]
+    if bullets:
+        return bullets
+    
+    lines = (match.group(1) for match in _PROSE_LINE_RE.finditer(text))
+    return list(itertools.islice((line for line in lines if not line.rstrip("*").endswith(":")), limit))
+
+
+_BATCH_HEADER = """You will complete {count} independent tasks. Answer every task fully and in order.
+Begin each answer with a line containing only its marker (for example "### TASK 1") and nothing else.
+
+"""
+
+# Output tokens allowed per task on top of its own cap, for the "### TASK N" marker line
+_BATCH_MARKER_TOKENS = 16
+
+_TASK_MARKER_RE = re.compile(r"^###\s*TASK\s+(\d+)\s*$", re.MULTILINE)
+
+
+def _split_batch_response(response: str, count: int) -> Optional[List[str]]:
+    """
+    Split a batched reply on its task markers; None unless every task has a
+    non-empty answer under markers numbered 1..count in order. Out-of-order
+    markers suggest the model mixed the tasks up, so they are not trusted.
+    """
+    parts = _TASK_MARKER_RE.split(response)
+    numbers = [int(number) for number in parts[1::2]]
+    sections = [body.strip() for body in parts[2::2]]
+    
+    if numbers != list(range(1, count + 1)) or not all(sections):
+        return None
+    return sections
+
+
+async def call_gemini_batch(
+    prompts: List[Tuple[str, float]],
+    cache_namespaces: Optional[List[Optional[str]]] = None,
+    max_tokens: Optional[List[Optional[int]]] = None
+) -> List[str]:
+    """
+    Answer several independent (prompt, temperature) pairs with one Gemini request.
+    
+    Prompts already in the prompt cache are answered from it. The rest are
+    grouped by temperature; each group of two or more is sent as numbered
+    "### TASK N" sections at that temperature, the groups concurrently, and
+    the reply is split back on those markers. Prompts left unanswered (alone
+    at their temperature, or in a reply that cannot be split cleanly) are
+    sent on their own, so the result always holds one answer per prompt.
+    
+    max_tokens gives each prompt's output cap; a batched request is capped at
+    their sum (plus room for the markers) when every prompt in it has one.
+    """
+    namespaces = cache_namespaces or [None] * len(prompts)
+    caps = max_tokens or [None] * len(prompts)
+    answers: List[Optional[str]] = [
+        _lookup_cached_response(prompt, temperature, namespace)
+        for (prompt, temperature), namespace in zip(prompts, namespaces)
+    ]
+    
+    # Batching only prompts that share a temperature keeps every answer generated
+    # (and cached) at the temperature its caller asked for
+    groups: Dict[float, List[int]] = {}
+    for i, answer in enumerate(answers):
+        if answer is None:
+            groups.setdefault(prompts[i][1], []).append(i)
+    
+    async def _answer_batch(temperature: float, batch: List[int]) -> None:
+        combined = _BATCH_HEADER.format(count=len(batch)) + "\n\n".join(
+            f"### TASK {number}\n{prompts[i][0]}" for number, i in enumerate(batch, start=1)
+        )
+        try:
+            batch_cap = None
+            if all(caps[i] for i in batch):
+                batch_cap = sum(caps[i] for i in batch) + _BATCH_MARKER_TOKENS * len(batch)
+            response = await _generate(combined, temperature, batch_cap)
+            sections = _split_batch_response(response, len(batch))
+            if sections is None:
+                logger.warning("Batched Gemini reply could not be split, falling back to single calls")
+                return
+            for i, text in zip(batch, sections):
+                answers[i] = text
+                _store_cached_response(prompts[i][0], namespaces[i], temperature, text)
+        except Exception as e:
+            logger.warning("Batched Gemini call failed, falling back to single calls: %s", e)
+    
+    async def _answer_alone(i: int) -> None:
+        prompt, temperature = prompts[i]
+        try:
+            text = await _generate(prompt, temperature, caps[i])
+            _store_cached_response(prompt, namespaces[i], temperature, text)
+            answers[i] = text
+        except Exception as e:
+            logger.error("Gemini call error: %s", e)
+            answers[i] = f"Error generating response: {e}"
+    
+    # Batches and prompts alone at their temperature go out together
+    await asyncio.gather(*(
+        _answer_batch(temperature, batch) if len(batch) > 1 else _answer_alone(batch[0])
+        for temperature, batch in groups.items()
+    ))
+    
+    # Prompts from batches whose reply failed or could not be split
+    missing = [i for i, answer in enumerate(answers) if answer is None]
+    await asyncio.gather(*(_answer_alone(i) for i in missing))
+    
+    return answers
+
+
+# Router keyword groups in priority order: group N of the regex maps to _ROUTER_DOMAINS[N - 1]
+_ROUTER_DOMAINS = ("finance", "housing", "visa")
+_ROUTER_KEYWORDS_RE = re.compile(r"\b(?:(finance|aid)|(housing|lease)|(visa|immigration))\b", re.IGNORECASE)
+
+
+# Explicit "DOMAIN: <name>" line the router prompt asks Gemini to open with
+_DOMAIN_LINE_RE = re.compile(r"^[ \t*]*DOMAIN:[ \t*]*(\w+)", re.IGNORECASE | re.MULTILINE)
+# Same line once it is complete in a partially streamed response
+_DOMAIN_LINE_DONE_RE = re.compile(r"^[ \t*]*DOMAIN:[ \t*]*\w+[ \t*]*\r?\n", re.IGNORECASE | re.MULTILINE)
+
+
+def _domain_from_analysis(analysis: str) -> str:
+    """
+    Map the router's analysis to a domain.
+    Prefers the explicit DOMAIN line and falls back to a single keyword
+    pass over the free text when the line is missing or unrecognised.
+    """
+    match = _DOMAIN_LINE_RE.search(analysis)
+    if match:
+        domain = match.group(1).lower()
+        if domain in _ROUTER_DOMAINS or domain == "general":
+            return domain
+    
+    matched = set()
+    for match in _ROUTER_KEYWORDS_RE.finditer(analysis):
+        if match.lastindex == 1:
+            return _ROUTER_DOMAINS[0]  # Highest priority, no need to keep scanning
+        matched.add(match.lastindex)
+    return _ROUTER_DOMAINS[min(matched) - 1] if matched else "general"
+
+
+# Unambiguous domain markers; a document hitting only one group can skip the LLM router
+_STRONG_SIGNALS = {
+    "visa": re.compile(r"\bI-20\b|\b[FJ]-1\b|\bSEVIS\b|\bDS-2019\b", re.IGNORECASE),
+    "finance": re.compile(r"\bFAFSA\b|\bbursar\b|\bfinancial aid\b|\bpromissory note\b", re.IGNORECASE),
+    "housing": re.compile(r"\bsublease\b|\blease agreement\b|\blandlord\b|\bsecurity deposit\b", re.IGNORECASE)
+}
+_STRONG_SIGNAL_SCAN_CHARS = 10000
+_STRONG_SIGNAL_MIN_HITS = 2
+
+
+def _strong_signal_domain(text: str) -> Optional[str]:
+    """
+    Classify a document without Gemini when it clearly belongs to one domain.
+    Returns None when no domain or more than one domain shows up.
+    """
+    sample = text[:_STRONG_SIGNAL_SCAN_CHARS]
+    hits = {}
+    for domain, pattern in _STRONG_SIGNALS.items():
+        count = sum(1 for _ in pattern.finditer(sample))
+        if count:
+            hits[domain] = count
+    
+    if len(hits) != 1:
+        return None
+    domain, count = hits.popitem()
+    return domain if count >= _STRONG_SIGNAL_MIN_HITS else None
+
+
+# Domain descriptions whose embeddings serve as centroids for the embedding router
+_ROUTER_SEEDS = {
+    "finance": "Financial aid award letter, tuition bill or student loan terms: fees, payment deadlines, refunds and late penalties",
+    "housing": "Residential lease agreement: rent, security deposit, move-in and move-out dates, maintenance and early termination",
+    "visa": "International student immigration compliance: F-1 or J-1 visa status, I-20, SEVIS, work authorization and health insurance"
+}
+
+
+async def _embedding_domain(text: str) -> Optional[str]:
+    """
+    Classify a document by cosine similarity of its embedding to each domain seed.
+    Returns None when the best match is weak or too close to the runner-up,
+    leaving the decision to Gemini.
+    """
+    centroids = await _fixed_query_embeddings(list(_ROUTER_SEEDS.values()))
+    if any(centroid is None for centroid in centroids):
+        return None
+    
+    try:
+        document = np.asarray(await embed_text(text[:ROUTER_EMBEDDING_CHARS]), dtype=np.float32)
+    except Exception as e:
+        logger.warning("Router embedding failed, falling back to Gemini: %s", e)
+        return None
+    
+    document_norm = np.linalg.norm(document)
+    if not document_norm:
+        return None
+    
+    matrix = np.asarray(centroids, dtype=np.float32)
+    scores = (matrix @ document) / (np.linalg.norm(matrix, axis=1) * document_norm)
+    runner_up, best = np.argsort(scores)[-2:]
+    if scores[best] < ROUTER_EMBEDDING_MIN_SIMILARITY or scores[best] - scores[runner_up] < ROUTER_EMBEDDING_MIN_MARGIN:
+        return None
+    return list(_ROUTER_SEEDS)[best]
+
+
 async def router_agent(state: AgentState) -> AgentState:
     """
     Router Agent: Classifies document and extracts initial context.
     Uses reasoning to understand what type of document this is and why.
     """
     try:
-        text = state.get("raw_text", "")
+        domain = _strong_signal_domain(state["raw_text"])
+        if domain:
+            state["domain"] = domain
+            logger.info("Router classified document as: %s (keyword match)", domain)
+            return state
         
-        prompt = f"""You are the Router Agent for document analysis. Analyze this document excerpt and determine:
+        text = _document_excerpt(state)
+        
+        domain = await _embedding_domain(text)
+        if domain:
+            state["domain"] = domain
+            logger.info("Router classified document as: %s (embedding match)", domain)
+            return state
+        
+        prompt = f"""You are the Router Agent for document analysis. Analyze the document excerpt at the end of this message and determine:
 
 1. What TYPE of document is this? (financial aid, lease agreement, visa requirement, etc.)
 2. What DOMAIN does it belong to? (finance, housing, visa, or multiple)
 3. What is the PRIMARY PURPOSE of this document?
 4. What are the 2-3 most CRITICAL concerns a student should be aware of?
 
-Document:
-{text[:3000]}
+Start your answer with a single line of the form "DOMAIN: <finance|housing|visa|general>" naming the best-fitting domain.
+Then provide your analysis in clear paragraphs. Be specific about the document type and domain.
 
-Provide your analysis in clear paragraphs. Be specific about the document type and domain."""
+Document:
+{text}"""
 
-        analysis = await call_gemini_with_reasoning(prompt, temperature=0.5)
+        analysis = await call_gemini_with_reasoning(
+            prompt,
+            temperature=0.5,
+            cache_namespace="router",
+            stop_pattern=_DOMAIN_LINE_DONE_RE,  # Only the domain is used, stop once it arrives
+            max_tokens=256
+        )
         
         # Extract domain from reasoning (simplified)
-        if "finance" in analysis.lower() or "aid" in analysis.lower():
-            state["domain"] = "finance"
-        elif "housing" in analysis.lower() or "lease" in analysis.lower():
-            state["domain"] = "housing"
-        elif "visa" in analysis.lower() or "immigration" in analysis.lower():
-            state["domain"] = "visa"
-        else:
-            state["domain"] = "general"
+        state["domain"] = _domain_from_analysis(analysis)
         
-        logger.info(f"Router classified document as: {state['domain']}")
+        logger.info("Router classified document as: %s", state["domain"])
         return state
         
     except Exception as e:
-        logger.error(f"Router agent error: {e}")
+        logger.error("Router agent error: %s", e)
         state["error"] = str(e)
         return state
 
 
-async def finance_agent(state: AgentState) -> AgentState:
-    """
-    Finance Agent: Extracts financial obligations, deadlines, and costs.
-    Uses reasoning to identify financial touchpoints and hidden fees.
-    """
-    try:
-        text = state.get("raw_text", "")
-        
-        # Get relevant financial context from retrieval tool
-        context = await get_context_for_agent(
-            query_text="tuition fees payment deadlines penalties financial obligations",
-            domain="finance",
-            top_k=5
-        )
-        
-        prompt = f"""You are the Finance Agent for document analysis. Your goal is to identify every financial touchpoint in this document.
+FINANCE_CONTEXT_QUERY = "tuition fees payment deadlines penalties financial obligations"
+HOUSING_CONTEXT_QUERY = "move-in move-out lease cancellation maintenance responsibilities"
+VISA_CONTEXT_QUERY = "visa I-20 F-1 J-1 immigration compliance status international"
 
-DOCUMENT TO ANALYZE:
-{text[:4000]}
+# Campus resource searches issued by the RAG agent
+RAG_FINANCIAL_AID_QUERY = "financial aid emergency loans bursar"
+RAG_TUITION_QUERY = "tuition payment plans financial assistance"
+RAG_HOUSING_QUERY = "housing off-campus residential life"
+RAG_VISA_QUERY = "international students visa immigration"
 
-RELEVANT CONTEXT FROM SIMILAR DOCUMENTS:
-{context}
+# Texts that never change at runtime (retrieval queries and router seeds);
+# see _fixed_query_embeddings
+_FIXED_QUERIES = (
+    *_ROUTER_SEEDS.values(),
+    FINANCE_CONTEXT_QUERY,
+    HOUSING_CONTEXT_QUERY,
+    VISA_CONTEXT_QUERY,
+    RAG_FINANCIAL_AID_QUERY,
+    RAG_TUITION_QUERY,
+    RAG_HOUSING_QUERY,
+    RAG_VISA_QUERY
+)
+
+
+# Fixed instruction prefixes for the domain agents. They are byte-identical across
+# documents, so _domain_prompt only appends the per-document context and text.
+FINANCE_PROMPT_PREFIX = """You are the Finance Agent for document analysis. Your goal is to identify every financial touchpoint in the document below.
 
 Analyze the document and:
 1. List ALL financial obligations (tuition, fees, payments, deposits, etc.)
@@ -151,47 +710,19 @@ Analyze the document and:
 4. Highlight HIDDEN COSTS or unusual financial terms
 5. Explain the FINANCIAL IMPACT if obligations aren't met
 
-Be thorough and scrutinize every financial detail. Present your findings as clear, actionable insights for a student."""
+Be thorough and scrutinize every financial detail. Present your findings as clear, actionable insights for a student.
 
-        analysis = await call_gemini_with_reasoning(prompt, temperature=0.7)
-        
-        state["financial_details"] = analysis
-        
-        # Extract obligations as a list (simple line-by-line parsing)
-        lines = analysis.split('\n')
-        obligations = [line.strip() for line in lines if line.strip() and len(line) > 20]
-        state["obligations"].extend(obligations[:10])  # Keep top findings
-        
-        return state
-        
-    except Exception as e:
-        logger.error(f"Finance agent error: {e}")
-        state["error"] = str(e)
-        return state
+RELEVANT CONTEXT FROM SIMILAR DOCUMENTS:
+"""
 
 
-async def housing_agent(state: AgentState) -> AgentState:
-    """
-    Housing Agent: Processes lease terms, dates, and cancellation policies.
-    Uses reasoning to identify logistical and legal housing realities.
-    """
-    try:
-        text = state.get("raw_text", "")
-        
-        # Get relevant housing context
-        context = await get_context_for_agent(
-            query_text="move-in move-out lease cancellation maintenance responsibilities",
-            domain="housing",
-            top_k=5
-        )
-        
-        prompt = f"""You are the Housing Agent specializing in residential agreements and leases.
+def _apply_finance_analysis(state: AgentState, analysis: str) -> None:
+    state["financial_details"] = analysis
+    
+    _extend_capped(state["obligations"], _extract_bullets(analysis, 10), MAX_STATE_OBLIGATIONS)  # Keep top findings
 
-DOCUMENT TO ANALYZE:
-{text[:4000]}
 
-RELEVANT HOUSING CONTEXT:
-{context}
+HOUSING_PROMPT_PREFIX = """You are the Housing Agent specializing in residential agreements and leases.
 
 Your task:
 1. Identify ALL move-in and move-out dates
@@ -201,63 +732,201 @@ Your task:
 5. Identify PENALTIES for damages, early termination, or policy violations
 6. Flag any UNUSUAL or UNFAIR terms that disadvantage the tenant
 
-Present your findings as a practical guide for the student."""
+Present your findings as a practical guide for the student.
+
+RELEVANT HOUSING CONTEXT:
+"""
+
+
+def _apply_housing_analysis(state: AgentState, analysis: str) -> None:
+    state["housing_details"] = analysis
+    _extend_capped(state["clauses"], [analysis], MAX_STATE_CLAUSES)
+
+
+VISA_PROMPT_PREFIX = """You are the Visa and Immigration Compliance Agent for international students.
+
+Your task:
+1. Extract ALL visa-related requirements (I-20, employment, health insurance, etc.)
+2. Identify COMPLIANCE OBLIGATIONS for F-1/J-1 status maintenance
+3. List STATUS CHANGE NOTIFICATIONS or conditions that could jeopardize visa
+4. Flag any CRITICAL DEADLINES for visa renewals or form submissions
+5. Identify LEGAL RISKS if obligations aren't met
+6. Highlight any unusual provisions that could affect immigration status
+
+Be comprehensive - missing a compliance obligation could result in visa revocation.
+
+RELEVANT COMPLIANCE CONTEXT:
+"""
+
+
+def _apply_visa_analysis(state: AgentState, analysis: str) -> None:
+    state["visa_details"] = analysis
+    _extend_capped(state["obligations"], _extract_bullets(analysis, 6), MAX_STATE_OBLIGATIONS)
+
+
+def _domain_prompt(prefix: str, text: str, context: str) -> str:
+    return f"{prefix}{context}\n\nDOCUMENT TO ANALYZE:\n{text}"
+
+
+# Per-domain wiring shared by the individual agents and the batched stage
+AGENT_SPECS: Dict[str, Dict[str, Any]] = {
+    "finance": {
+        "context_query": FINANCE_CONTEXT_QUERY,
+        "prompt_prefix": FINANCE_PROMPT_PREFIX,
+        "temperature": 0.7,
+        "max_tokens": 768,
+        "apply": _apply_finance_analysis,
+        "relevance": re.compile(r"\$|\bfees?\b|tuition|payment|\bpay\b|refund|penalt|deadline|\bloans?\b|financial aid|scholarship|bursar|balance", re.IGNORECASE)
+    },
+    "housing": {
+        "context_query": HOUSING_CONTEXT_QUERY,
+        "prompt_prefix": HOUSING_PROMPT_PREFIX,
+        "temperature": 0.7,
+        "max_tokens": 1024,
+        "apply": _apply_housing_analysis,
+        "relevance": re.compile(r"\blease|\brent\b|move-?in|move-?out|landlord|tenant|deposit|maintenance|sublet|sublease|terminat|utilit", re.IGNORECASE)
+    },
+    "visa": {
+        "context_query": VISA_CONTEXT_QUERY,
+        "prompt_prefix": VISA_PROMPT_PREFIX,
+        "temperature": 0.5,
+        "max_tokens": 768,
+        "apply": _apply_visa_analysis,
+        "relevance": re.compile(r"\bvisa\b|\bI-20\b|\b[FJ]-1\b|\bSEVIS\b|immigration|international student|work authorization|employment|health insurance|\bstatus\b", re.IGNORECASE)
+    }
+}
+
+
+def _slice_for_domain(text: str, pattern: Pattern) -> str:
+    """
+    Collect the passages around matches of a domain's relevance pattern,
+    merging overlapping windows, until DOMAIN_SLICE_CHARS are gathered.
+    """
+    windows: List[List[int]] = []
+    total = 0
+    for match in pattern.finditer(text):
+        start = max(0, match.start() - DOMAIN_SLICE_WINDOW_CHARS)
+        end = min(len(text), match.end() + DOMAIN_SLICE_WINDOW_CHARS)
+        if windows and start <= windows[-1][1]:
+            total += end - windows[-1][1]
+            windows[-1][1] = end
+        else:
+            total += end - start
+            windows.append([start, end])
+        if total >= DOMAIN_SLICE_CHARS:
+            break
+    
+    return "\n...\n".join(text[start:end].strip() for start, end in windows)[:DOMAIN_SLICE_CHARS]
+
 
-        analysis = await call_gemini_with_reasoning(prompt, temperature=0.7)
+def _domain_excerpt(state: AgentState, name: str) -> str:
+    """
+    Document passages relevant to one domain agent, computed once per workflow.
+    Falls back to the shared excerpt when the document never mentions the domain.
+    """
+    slices = state["domain_slices"]
+    if name not in slices:
+        slices[name] = _slice_for_domain(state["raw_text"], AGENT_SPECS[name]["relevance"])
+    return slices[name] or _document_excerpt(state)
+
+
+async def run_agent(name: str, state: AgentState) -> AgentState:
+    """
+    Run a single domain agent from its AGENT_SPECS entry:
+    fetch retrieval context, call Gemini and write the analysis to state.
+    """
+    spec = AGENT_SPECS[name]
+    if _too_short_to_analyze(state, f"{name} agent"):
+        return state
+    
+    try:
+        text = _domain_excerpt(state, name)
         
-        state["housing_details"] = analysis
-        state["clauses"].append(analysis)
+        context = await get_context_for_agent(
+            query_text=spec["context_query"],
+            domain=name,
+            top_k=5
+        )
+        
+        analysis = await call_gemini_with_reasoning(
+            _domain_prompt(spec["prompt_prefix"], text, context),
+            temperature=spec["temperature"],
+            cache_namespace=name,
+            max_tokens=spec["max_tokens"]
+        )
         
+        spec["apply"](state, analysis)
         return state
         
     except Exception as e:
-        logger.error(f"Housing agent error: {e}")
+        logger.error("%s agent error: %s", name.capitalize(), e)
         state["error"] = str(e)
         return state
 
 
+async def finance_agent(state: AgentState) -> AgentState:
+    """
+    Finance Agent: Extracts financial obligations, deadlines, and costs.
+    Uses reasoning to identify financial touchpoints and hidden fees.
+    """
+    return await run_agent("finance", state)
+
+
+async def housing_agent(state: AgentState) -> AgentState:
+    """
+    Housing Agent: Processes lease terms, dates, and cancellation policies.
+    Uses reasoning to identify logistical and legal housing realities.
+    """
+    return await run_agent("housing", state)
+
+
 async def visa_agent(state: AgentState) -> AgentState:
     """
     Visa Agent: Extracts visa requirements and compliance obligations.
     Uses reasoning to ensure international students maintain legal standing.
     """
+    return await run_agent("visa", state)
+
+
+async def run_domain_agents(state: AgentState) -> AgentState:
+    """
+    Run the domain agent the router picked, or every agent in AGENT_SPECS
+    together when the document is "general" (or could not be routed).
+    With several agents, their retrieval contexts are fetched in one
+    multi-domain call and the prompts go to Gemini as one batched request,
+    so the stage costs one retrieval round and one LLM round-trip instead
+    of one of each per agent.
+    """
+    if _too_short_to_analyze(state, "domain agents"):
+        return state
+    
     try:
-        text = state.get("raw_text", "")
+        domain = state["domain"]
+        names = [domain] if domain in AGENT_SPECS else list(AGENT_SPECS)
         
-        # Get relevant visa context
-        context = await get_context_for_agent(
-            query_text="visa I-20 F-1 J-1 immigration compliance status international",
-            domain="visa",
+        contexts = await get_contexts_for_agents(
+            [(AGENT_SPECS[name]["context_query"], name) for name in names],
             top_k=5
         )
         
-        prompt = f"""You are the Visa and Immigration Compliance Agent for international students.
-
-DOCUMENT TO ANALYZE:
-{text[:4000]}
-
-RELEVANT COMPLIANCE CONTEXT:
-{context}
-
-Your task:
-1. Extract ALL visa-related requirements (I-20, employment, health insurance, etc.)
-2. Identify COMPLIANCE OBLIGATIONS for F-1/J-1 status maintenance
-3. List STATUS CHANGE NOTIFICATIONS or conditions that could jeopardize visa
-4. Flag any CRITICAL DEADLINES for visa renewals or form submissions
-5. Identify LEGAL RISKS if obligations aren't met
-6. Highlight any unusual provisions that could affect immigration status
-
-Be comprehensive - missing a compliance obligation could result in visa revocation."""
-
-        analysis = await call_gemini_with_reasoning(prompt, temperature=0.5)
-        
-        state["visa_details"] = analysis
-        state["obligations"].append(analysis)
+        analyses = await call_gemini_batch(
+            [
+                (
+                    _domain_prompt(AGENT_SPECS[name]["prompt_prefix"], _domain_excerpt(state, name), context),
+                    AGENT_SPECS[name]["temperature"]
+                )
+                for name, context in zip(names, contexts)
+            ],
+            cache_namespaces=names,
+            max_tokens=[AGENT_SPECS[name]["max_tokens"] for name in names]
+        )
         
+        for name, analysis in zip(names, analyses):
+            AGENT_SPECS[name]["apply"](state, analysis)
         return state
         
     except Exception as e:
-        logger.error(f"Visa agent error: {e}")
+        logger.error("Domain agents error: %s", e)
         state["error"] = str(e)
         return state
 
@@ -274,51 +943,88 @@ async def rag_agent(state: AgentState) -> AgentState:
         
         # Determine what resources to search for based on agent findings
         search_queries = []
-        if financial_context and "penalty" in financial_context.lower():
-            search_queries.append("financial aid emergency loans bursar")
-        if financial_context and "tuition" in financial_context.lower():
-            search_queries.append("tuition payment plans financial assistance")
+        financial_lower = financial_context.lower() if financial_context else ""
+        if "penalty" in financial_lower:
+            search_queries.append(RAG_FINANCIAL_AID_QUERY)
+        if "tuition" in financial_lower:
+            search_queries.append(RAG_TUITION_QUERY)
         if housing_context:
-            search_queries.append("housing off-campus residential life")
+            search_queries.append(RAG_HOUSING_QUERY)
         if visa_context:
-            search_queries.append("international students visa immigration")
+            search_queries.append(RAG_VISA_QUERY)
+        
+        # Nothing to look up when the domain agents produced no findings (e.g. they all failed)
+        if not search_queries:
+            state["resources"] = []
+            return state
         
+        # Queries are independent, so uncached ones are retrieved as one batch
+        results = await _retrieve_clauses(search_queries, top_k=3)
+        
+        # A clause returned by several queries is only listed under the first one
         resources = []
-        for query in search_queries:
-            context = await get_context_for_agent(
-                query_text=query,
-                top_k=3
-            )
-            if context and "No relevant context" not in context:
+        seen_texts = set()
+        for query, clauses in zip(search_queries, results):
+            unique = []
+            for clause in clauses:
+                clause_text = clause.get("clause_text", "")
+                if clause_text and clause_text not in seen_texts:
+                    seen_texts.add(clause_text)
+                    unique.append(clause)
+            
+            if unique:
                 resources.append({
                     "query": query,
-                    "context": context
+                    "context": _format_context(unique)
                 })
         
         state["resources"] = resources
         return state
         
     except Exception as e:
-        logger.error(f"RAG agent error: {e}")
+        logger.error("RAG agent error: %s", e)
         state["error"] = str(e)
         return state
 
 
+# Red-flag keywords in the risk analysis, in the order their messages are reported
+_RISK_FLAGS = {
+    "high": "Document contains high-risk terms",
+    "predatory": "Potentially predatory practices identified",
+    "ambiguous": "Ambiguous language that could harm student"
+}
+_RISK_KEYWORDS_RE = re.compile(r"\b(high|predatory|ambiguous)\b", re.IGNORECASE)
+
+
 async def risk_agent(state: AgentState) -> AgentState:
     """
     Risk Agent: Performs holistic risk assessment through reasoning.
     Identifies red flags and explains risks in human terms, not math.
     """
+    if _too_short_to_analyze(state, "risk agent"):
+        return state
+    
     try:
-        text = state.get("raw_text", "")
+        text = _document_excerpt(state)
         financial = state.get("financial_details", "")
         housing = state.get("housing_details", "")
         visa = state.get("visa_details", "")
         
-        prompt = f"""You are the Risk Agent - the final auditor of this document analysis. Your job is to identify RISKS and RED FLAGS.
+        prompt = f"""You are the Risk Agent - the final auditor of this document analysis. Your job is to identify RISKS and RED FLAGS in the document and agent analyses below.
+
+Analyze them and:
+1. IDENTIFY CONFLICTS between different sections or clauses
+2. FLAG HIGH-LIABILITY TERMS that could harm the student
+3. Highlight PREDATORY PRACTICES (e.g., excessive penalties, waived rights)
+4. Look for AMBIGUOUS LANGUAGE that could be interpreted against the student
+5. Assess OVERALL RISK LEVEL based on reasoning, not math
+
+Assign an overall risk level: LOW, MEDIUM, or HIGH
+
+Provide specific reasoning for each red flag. Be direct about what could go wrong.
 
 ORIGINAL DOCUMENT:
-{text[:3000]}
+{text}
 
 FINANCIAL ANALYSIS:
 {financial}
@@ -327,34 +1033,62 @@ HOUSING ANALYSIS:
 {housing}
 
 VISA ANALYSIS:
-{visa}
+{visa}"""
 
-Now analyze and:
-1. IDENTIFY CONFLICTS between different sections or clauses
-2. FLAG HIGH-LIABILITY TERMS that could harm the student
-3. Highlight PREDATORY PRACTICES (e.g., excessive penalties, waived rights)
-4. Look for AMBIGUOUS LANGUAGE that could be interpreted against the student
-5. Assess OVERALL RISK LEVEL based on reasoning, not math
-
-Assign an overall risk level: LOW, MEDIUM, or HIGH
-
-Provide specific reasoning for each red flag. Be direct about what could go wrong."""
-
-        analysis = await call_gemini_with_reasoning(prompt, temperature=0.7)
+        analysis = await call_gemini_with_reasoning(
+            prompt,
+            temperature=0.7,
+            cache_namespace="risk",
+            max_tokens=1024
+        )
         
         state["risk_assessment"] = analysis
         
         # Extract red flags (simple pattern matching on reasoning)
-        if "high" in analysis.lower():
-            state["red_flags"].append("Document contains high-risk terms")
-        if "predatory" in analysis.lower():
-            state["red_flags"].append("Potentially predatory practices identified")
-        if "ambiguous" in analysis.lower():
-            state["red_flags"].append("Ambiguous language that could harm student")
+        found = {keyword.lower() for keyword in _RISK_KEYWORDS_RE.findall(analysis)}
+        _extend_capped(
+            state["red_flags"],
+            (message for keyword, message in _RISK_FLAGS.items() if keyword in found),
+            MAX_STATE_RED_FLAGS
+        )
         
         return state
         
     except Exception as e:
-        logger.error(f"Risk agent error: {e}")
+        logger.error("Risk agent error: %s", e)
         state["error"] = str(e)
         return state
+
+
+async def _run_isolated(agent, state: AgentState) -> AgentState:
+    """
+    Run an agent on a shallow copy of the state, bounded by AGENT_TIMEOUT_SECONDS.
+    The copy owns its own red_flags list so concurrent agents never share a mutable field.
+    """
+    local_state = AgentState(**state)
+    local_state["red_flags"] = list(state["red_flags"])
+    try:
+        async with asyncio.timeout(AGENT_TIMEOUT_SECONDS):
+            return await agent(local_state)
+    except TimeoutError:
+        logger.error("%s timed out after %ss", agent.__name__, AGENT_TIMEOUT_SECONDS)
+        local_state["error"] = f"{agent.__name__} timed out"
+        return local_state
+
+
+async def run_review_agents(state: AgentState) -> AgentState:
+    """
+    Run the RAG and Risk agents together.
+    Both only read the domain analyses, so each works on its own state copy
+    and their outputs are merged back once both have finished.
+    """
+    async with asyncio.TaskGroup() as tg:
+        rag_task = tg.create_task(_run_isolated(rag_agent, state))
+        risk_task = tg.create_task(_run_isolated(risk_agent, state))
+    rag_state, risk_state = rag_task.result(), risk_task.result()
+    
+    state["resources"] = rag_state["resources"]
+    state["risk_assessment"] = risk_state["risk_assessment"]
+    state["red_flags"] = risk_state["red_flags"]
+    state["error"] = risk_state["error"] or rag_state["error"]
+    return state
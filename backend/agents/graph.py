@@ -1,14 +1,11 @@
 import logging
-import asyncio
 from langgraph.graph import StateGraph, END
 from agents.base_agents import (
     AgentState,
+    new_agent_state,
     router_agent,
-    finance_agent,
-    housing_agent,
-    visa_agent,
-    rag_agent,
-    risk_agent
+    run_domain_agents,
+    run_review_agents
 )
 
 logger = logging.getLogger(__name__)
@@ -19,61 +16,29 @@ def build_graph():
     Build the LangGraph workflow for document analysis.
     
     Flow:
-    Router → (Finance/Housing/Visa based on domain) → RAG → Risk → Output
+    Router → routed domain agent (Finance + Housing + Visa concurrently for
+    "general" documents) → (RAG + Risk concurrently) → Output
     """
     graph = StateGraph(AgentState)
     
-    # Convert async agents to sync wrappers for LangGraph
-    def sync_router(state):
-        return asyncio.run(router_agent(state))
-    
-    def sync_finance(state):
-        return asyncio.run(finance_agent(state))
-    
-    def sync_housing(state):
-        return asyncio.run(housing_agent(state))
-    
-    def sync_visa(state):
-        return asyncio.run(visa_agent(state))
-    
-    def sync_rag(state):
-        return asyncio.run(rag_agent(state))
-    
-    def sync_risk(state):
-        return asyncio.run(risk_agent(state))
-    
-    # Add nodes
-    graph.add_node("router", sync_router)
-    graph.add_node("finance", sync_finance)
-    graph.add_node("housing", sync_housing)
-    graph.add_node("visa", sync_visa)
-    graph.add_node("rag", sync_rag)
-    graph.add_node("risk", sync_risk)
-    
-    # Router determines which specialized agent to call
-    def route_to_domain(state):
-        domain = state.get("domain", "general")
-        if domain == "finance":
-            return "finance"
-        elif domain == "housing":
-            return "housing"
-        elif domain == "visa":
-            return "visa"
-        else:
-            return "rag"  # Default to RAG if no specific domain
+    # Agents are coroutines; LangGraph awaits them directly on the caller's event loop
+    graph.add_node("router", router_agent)
+    graph.add_node("domain_agents", run_domain_agents)
+    graph.add_node("review_agents", run_review_agents)
     
     # Define edges
-    graph.add_edge("START", "router")
-    graph.add_conditional_edges("router", route_to_domain)
-    graph.add_edge("finance", "rag")
-    graph.add_edge("housing", "rag")
-    graph.add_edge("visa", "rag")
-    graph.add_edge("rag", "risk")
-    graph.add_edge("risk", END)
+    graph.set_entry_point("router")
+    graph.add_edge("router", "domain_agents")
+    graph.add_edge("domain_agents", "review_agents")
+    graph.add_edge("review_agents", END)
     
     return graph.compile()
 
 
+# The graph has no per-request configuration, so it is compiled once and shared
+workflow = build_graph()
+
+
 async def run_analysis_workflow(session_id: str, raw_text: str):
     """
     Execute the full analysis workflow.
@@ -81,35 +46,17 @@ async def run_analysis_workflow(session_id: str, raw_text: str):
     Returns the final state with all agent outputs.
     """
     try:
-        graph = build_graph()
-        
         # Initialize state
-        initial_state = AgentState(
-            session_id=session_id,
-            raw_text=raw_text,
-            domain="",
-            language="en",
-            clauses=[],
-            obligations=[],
-            financial_details=None,
-            housing_details=None,
-            visa_details=None,
-            risk_assessment=None,
-            red_flags=[],
-            resources=[],
-            translation=None,
-            scenario=None,
-            error=None
-        )
+        initial_state = new_agent_state(session_id, raw_text)
         
         # Run the workflow
-        final_state = await asyncio.to_thread(graph.invoke, initial_state)
+        final_state = await workflow.ainvoke(initial_state)
         
-        logger.info(f"Analysis complete for session {session_id}")
+        logger.info("Analysis complete for session %s", session_id)
         return final_state
         
     except Exception as e:
-        logger.error(f"Workflow execution error: {e}")
+        logger.error("Workflow execution error: %s", e)
         return {
             "error": str(e),
             "session_id": session_id
@@ -4,6 +4,9 @@ from agents.base_agents import AgentState, call_gemini_with_reasoning, get_conte
 
 logger = logging.getLogger(__name__)
 
+# Target languages that need no translation (compared lowercased)
+_ENGLISH_LANGUAGES = frozenset({"", "en", "en-us", "en-gb"})
+
 
 async def translation_agent(state: AgentState) -> AgentState:
     """
@@ -11,10 +14,10 @@ async def translation_agent(state: AgentState) -> AgentState:
     Uses reasoning to explain legal/financial jargon in simple terms.
     """
     try:
-        clauses = state.get("clauses", [])
-        language = state.get("language", "en")
+        clauses = state["clauses"]
+        language = state["language"]
         
-        if language == "en" or not clauses:
+        if not clauses or language.lower() in _ENGLISH_LANGUAGES:
             return state
         
         clauses_text = "\n".join(clauses[:5])  # Top 5 clauses
@@ -28,13 +31,13 @@ TARGET LANGUAGE: {language}
 
 Provide clear, simple explanations. Avoid jargon. Make sure the student understands what they're actually agreeing to."""
 
-        translation = await call_gemini_with_reasoning(prompt, temperature=0.6)
+        translation = await call_gemini_with_reasoning(prompt, temperature=0.6, max_tokens=1024)
         state["translation"] = translation
         
         return state
         
     except Exception as e:
-        logger.error(f"Translation agent error: {e}")
+        logger.error("Translation agent error: %s", e)
         return state
 
 
@@ -46,7 +49,7 @@ async def scenario_agent(state: AgentState) -> AgentState:
     try:
         financial = state.get("financial_details", "")
         housing = state.get("housing_details", "")
-        obligations = state.get("obligations", [])
+        obligations = state["obligations"]
         
         if not financial and not housing and not obligations:
             return state
@@ -69,11 +72,11 @@ For each scenario:
 
 Make scenarios concrete and actionable."""
 
-        scenarios = await call_gemini_with_reasoning(prompt, temperature=0.8)
+        scenarios = await call_gemini_with_reasoning(prompt, temperature=0.8, max_tokens=1024)
         state["scenario"] = scenarios
         
         return state
         
     except Exception as e:
-        logger.error(f"Scenario agent error: {e}")
+        logger.error("Scenario agent error: %s", e)
         return state
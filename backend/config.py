@@ -8,10 +8,70 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 GEMINI_MODEL = "gemini-1.5-flash"
 GEMINI_EMBEDDING_MODEL = "text-embedding-004"
 
+# Embedding router: document prefix embedded and the confidence needed to skip the Gemini router.
+# Set conservatively rather than tuned on labelled documents: text-embedding-004 puts loosely
+# related passages around 0.4-0.55 cosine similarity, so a document must sit well above that
+# against one seed and lead the runner-up by a clear margin. Mixed documents (e.g. a lease
+# that mentions tuition) score close on two seeds and are left to Gemini; lowering either
+# value trades more skipped Gemini calls for more misrouted documents
+ROUTER_EMBEDDING_CHARS = 2000
+ROUTER_EMBEDDING_MIN_SIMILARITY = 0.65
+ROUTER_EMBEDDING_MIN_MARGIN = 0.1
+
+# Exact-match cache for Gemini responses
+PROMPT_CACHE_MAX_ENTRIES = 512
+PROMPT_CACHE_TTL_SECONDS = 24 * 60 * 60
+
+# Exact-text cache for Gemini embeddings of queries, clauses and routed documents
+EMBEDDING_CACHE_MAX_ENTRIES = 1024
+EMBEDDING_CACHE_TTL_SECONDS = 24 * 60 * 60
+
+# Texts per Gemini batchEmbedContents request (the API accepts at most 100)
+EMBEDDING_BATCH_SIZE = 100
+# Batch embedding requests allowed in flight at once
+EMBEDDING_MAX_CONCURRENCY = 5
+
+# Atlas $vectorSearch candidates per requested result, and the floor for small top_k
+VECTOR_SEARCH_CANDIDATES_PER_RESULT = 15
+VECTOR_SEARCH_MIN_CANDIDATES = 50
+
+# Vector search results reused for near-identical query embeddings (e.g. reworded questions)
+QUERY_CACHE_SIMILARITY = 0.97
+QUERY_CACHE_MAX_ENTRIES = 256
+QUERY_CACHE_TTL_SECONDS = 600
+
+# Cache for agent retrieval context (fixed queries, invalidated on vector store writes)
+RETRIEVAL_CACHE_MAX_ENTRIES = 128
+RETRIEVAL_CACHE_TTL_SECONDS = 600
+
+# Upper bound on a single agent run in the concurrent workflow stages
+AGENT_TIMEOUT_SECONDS = 60
+
+# Documents with less extracted text than this skip the Gemini-backed analysis agents
+MIN_DOCUMENT_CHARS = 200
+
+# Upper bounds on the list fields accumulated in the agent state
+MAX_STATE_OBLIGATIONS = 20
+MAX_STATE_CLAUSES = 10
+MAX_STATE_RED_FLAGS = 10
+
+# Token budget for the document excerpt included in agent prompts
+PROMPT_DOCUMENT_TOKENS = 1000
+
+# Per-domain document passages sent to the finance/housing/visa agents
+DOMAIN_SLICE_CHARS = 2000
+DOMAIN_SLICE_WINDOW_CHARS = 200
+
 # MongoDB Atlas
 MONGODB_URI = os.getenv("MONGODB_URI")
 MONGODB_DB_NAME = "navigate413"
 
+# Motor connection pool; MONGODB_WARM_CONNECTIONS sockets are opened at startup
+MONGODB_MIN_POOL_SIZE = 5
+MONGODB_MAX_POOL_SIZE = 50
+MONGODB_MAX_IDLE_TIME_MS = 60000
+MONGODB_WARM_CONNECTIONS = 5
+
 # DigitalOcean Spaces
 DO_SPACES_KEY = os.getenv("DO_SPACES_KEY")
 DO_SPACES_SECRET = os.getenv("DO_SPACES_SECRET")
@@ -23,6 +83,3 @@ DO_SPACES_ENDPOINT = f"https://{DO_SPACES_REGION}.digitaloceanspaces.com"
 TEMP_FILE_DIR = "/tmp/navigate413"
 FILE_RETENTION_HOURS = 24
 MAX_FILE_SIZE_MB = 50
-
-# Ensure temp directory exists
-os.makedirs(TEMP_FILE_DIR, exist_ok=True)
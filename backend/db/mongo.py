@@ -1,30 +1,47 @@
+import asyncio
 import logging
-from motor.motor_asyncio import AsyncClient, AsyncDatabase
-from pymongo import ASCENDING, DESCENDING
-from config import MONGODB_URI, MONGODB_DB_NAME
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from config import (
+    MONGODB_URI,
+    MONGODB_DB_NAME,
+    MONGODB_MIN_POOL_SIZE,
+    MONGODB_MAX_POOL_SIZE,
+    MONGODB_MAX_IDLE_TIME_MS,
+    MONGODB_WARM_CONNECTIONS
+)
 
 logger = logging.getLogger(__name__)
 
-_client: AsyncClient = None
-_db: AsyncDatabase = None
+_client: AsyncIOMotorClient = None
+_db: AsyncIOMotorDatabase = None
 
 
 async def connect_to_mongo():
     """Initialize MongoDB connection."""
     global _client, _db
     try:
-        _client = AsyncClient(MONGODB_URI)
+        _client = AsyncIOMotorClient(
+            MONGODB_URI,
+            minPoolSize=MONGODB_MIN_POOL_SIZE,
+            maxPoolSize=MONGODB_MAX_POOL_SIZE,
+            maxIdleTimeMS=MONGODB_MAX_IDLE_TIME_MS
+        )
         _db = _client[MONGODB_DB_NAME]
         
         # Verify connection
         await _db.command("ping")
         logger.info("Connected to MongoDB Atlas")
         
+        # Concurrent pings check out separate sockets, so the first requests
+        # find authenticated TLS connections already open in the pool
+        await asyncio.gather(*(_db.command("ping") for _ in range(MONGODB_WARM_CONNECTIONS)))
+        
         # Create indexes
         await _create_indexes()
         return _db
     except Exception as e:
-        logger.error(f"Failed to connect to MongoDB: {e}")
+        logger.error("Failed to connect to MongoDB: %s", e)
         raise
 
 
@@ -37,27 +54,35 @@ async def disconnect_from_mongo():
 
 
 async def _create_indexes():
-    """Create necessary MongoDB indexes."""
-    if not _db:
+    """Create necessary MongoDB indexes, one round-trip per collection."""
+    if _db is None:
         return
     
     try:
         # Documents metadata collection indexes
-        docs_col = _db["documents_metadata"]
-        await docs_col.create_index([("user_session_id", ASCENDING)])
-        await docs_col.create_index([("upload_timestamp", DESCENDING)])
+        await _db["documents_metadata"].create_indexes([
+            IndexModel([("user_session_id", ASCENDING)]),
+            IndexModel([("upload_timestamp", DESCENDING)])
+        ])
         
         # Clause embeddings collection indexes
-        clauses_col = _db["clause_embeddings"]
-        await clauses_col.create_index([("session_id", ASCENDING)])
-        await clauses_col.create_index([("domain", ASCENDING)])
+        await _db["clause_embeddings"].create_indexes([
+            IndexModel([("session_id", ASCENDING)]),
+            IndexModel([("domain", ASCENDING)]),
+            IndexModel([("clause_hash", ASCENDING)]),
+            IndexModel(
+                [("session_id", ASCENDING), ("clause_hash", ASCENDING)],
+                unique=True,
+                partialFilterExpression={"clause_hash": {"$exists": True}}
+            )
+        ])
         
         logger.info("MongoDB indexes created successfully")
     except Exception as e:
-        logger.warning(f"Index creation warning (may already exist): {e}")
+        logger.warning("Index creation warning (may already exist): %s", e)
 
 
-def get_db() -> AsyncDatabase:
+def get_db() -> AsyncIOMotorDatabase:
     """Get the current database instance."""
     if _db is None:
         raise RuntimeError("Database not connected. Call connect_to_mongo() first.")
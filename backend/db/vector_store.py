@@ -1,78 +1,248 @@
+import asyncio
+import hashlib
 import logging
-from typing import Optional, List, Dict, Any
+import time
+from typing import Optional, List, Dict, Any, Iterable, Tuple
 import google.generativeai as genai
-from config import GEMINI_EMBEDDING_MODEL, GEMINI_API_KEY
+from pymongo import UpdateOne, WriteConcern
+from pymongo.errors import OperationFailure
+from config import (
+    GEMINI_EMBEDDING_MODEL,
+    GEMINI_API_KEY,
+    EMBEDDING_CACHE_MAX_ENTRIES,
+    EMBEDDING_CACHE_TTL_SECONDS,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_MAX_CONCURRENCY,
+    VECTOR_SEARCH_CANDIDATES_PER_RESULT,
+    VECTOR_SEARCH_MIN_CANDIDATES,
+    QUERY_CACHE_SIMILARITY,
+    QUERY_CACHE_MAX_ENTRIES,
+    QUERY_CACHE_TTL_SECONDS
+)
 from db.mongo import get_db
+from tools.semantic_cache import SemanticCache
+from tools.ttl_cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
 # Configure Gemini
 genai.configure(api_key=GEMINI_API_KEY)
 
+# Write counters per (collection, domain) so callers can invalidate cached search results;
+# the (collection, None) counter moves on every write to that collection
+_write_epochs: Dict[Tuple[str, Optional[str]], int] = {}
+
+# Embeddings keyed by a digest of the embedded text, so repeated clauses and queries skip Gemini
+_embedding_cache = TTLCache(
+    max_entries=EMBEDDING_CACHE_MAX_ENTRIES,
+    ttl_seconds=EMBEDDING_CACHE_TTL_SECONDS
+)
+
+
+def get_write_epoch(collection_name: str = "clause_embeddings", domain: Optional[str] = None) -> int:
+    """
+    Return a counter that changes whenever the collection is written to.
+    With a domain, only writes tagged with that domain move the counter.
+    """
+    return _write_epochs.get((collection_name, domain), 0)
+
+
+def _bump_write_epoch(collection_name: str, domains: Iterable[Optional[str]] = ()) -> None:
+    for key in {(collection_name, None), *((collection_name, domain) for domain in domains)}:
+        _write_epochs[key] = _write_epochs.get(key, 0) + 1
+
+
+# Search results keyed by query embedding, bucketed per (collection, domain, top_k, num_candidates);
+# values are (expiry, write epoch, results) so stale or overwritten results are never served
+_query_cache = SemanticCache(
+    threshold=QUERY_CACHE_SIMILARITY,
+    max_entries=QUERY_CACHE_MAX_ENTRIES
+)
+
+# Atlas Vector Search index defined on each searchable collection. Both need "domain"
+# declared as a filter field so vector_search can filter inside $vectorSearch:
+#   {
+#     "fields": [
+#       {"type": "vector", "path": "embedding", "numDimensions": 768, "similarity": "cosine"},
+#       {"type": "filter", "path": "domain"}
+#     ]
+#   }
+_VECTOR_INDEXES = {
+    "clause_embeddings": "clause_vector_index",
+    "campus_resources_vector": "campus_resource_index"
+}
+
+# Indexes found without the "domain" filter field; their searches filter after $vectorSearch
+_unfiltered_indexes = set()
+
+# Caps concurrent batch embedding requests across all callers
+_embedding_semaphore = asyncio.Semaphore(EMBEDDING_MAX_CONCURRENCY)
+
+_CLAUSE_WRITE_CONCERN = WriteConcern(w=1)
+
+
+def _embedding_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
 
 async def embed_text(text: str) -> List[float]:
     """Generate embedding for text using Gemini."""
+    key = _embedding_key(text)
+    cached = _embedding_cache.get(key)
+    if cached is not None:
+        return cached
+    
     try:
-        result = genai.embed_content(
+        # The SDK has no async embedding call; keep it off the event loop
+        result = await asyncio.to_thread(
+            genai.embed_content,
             model=GEMINI_EMBEDDING_MODEL,
             content=text
         )
-        return result['embedding']
+        embedding = result['embedding']
+        _embedding_cache.put(key, embedding)
+        return embedding
     except Exception as e:
-        logger.error(f"Embedding failed: {e}")
+        logger.error("Embedding failed: %s", e)
         raise
 
 
+async def embed_texts(texts: List[str]) -> List[List[float]]:
+    """
+    Generate embeddings for several texts in batched Gemini requests of up to
+    EMBEDDING_BATCH_SIZE texts, at most EMBEDDING_MAX_CONCURRENCY in flight.
+    Texts embedded recently are served from the cache and left out of the requests.
+    """
+    keys = [_embedding_key(text) for text in texts]
+    embeddings = [_embedding_cache.get(key) for key in keys]
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if not missing:
+        return embeddings
+    
+    async def embed_batch(batch: List[int]) -> None:
+        async with _embedding_semaphore:
+            result = await asyncio.to_thread(
+                genai.embed_content,
+                model=GEMINI_EMBEDDING_MODEL,
+                content=[texts[i] for i in batch]
+            )
+        for i, embedding in zip(batch, result['embedding']):
+            embeddings[i] = embedding
+            _embedding_cache.put(keys[i], embedding)
+    
+    try:
+        await asyncio.gather(*(
+            embed_batch(missing[start:start + EMBEDDING_BATCH_SIZE])
+            for start in range(0, len(missing), EMBEDDING_BATCH_SIZE)
+        ))
+        return embeddings
+    except Exception as e:
+        logger.error("Batch embedding failed: %s", e)
+        raise
+
+
+async def _run_vector_search(
+    collection,
+    search: Dict[str, Any],
+    top_k: int,
+    post_filter_domain: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Run a $vectorSearch stage, optionally followed by a $match on domain."""
+    pipeline = [{"$vectorSearch": search}]
+    if post_filter_domain:
+        pipeline.append({"$match": {"domain": post_filter_domain}})
+    
+    # Project relevant fields
+    pipeline.append({
+        "$project": {
+            "clause_text": 1,
+            "resource_name": 1,
+            "description": 1,
+            "url": 1,
+            "domain": 1,
+            "risk_metadata": 1,
+            "score": {"$meta": "vectorSearchScore"}
+        }
+    })
+    
+    # $vectorSearch returns at most top_k documents, so bound the buffer to match
+    return await collection.aggregate(pipeline).to_list(top_k)
+
+
 async def vector_search(
     query_text: str,
     domain_filter: Optional[str] = None,
     top_k: int = 3,
-    collection_name: str = "clause_embeddings"
+    collection_name: str = "clause_embeddings",
+    query_embedding: Optional[List[float]] = None,
+    num_candidates: Optional[int] = None
 ) -> List[Dict[str, Any]]:
-    """Perform vector search against MongoDB Atlas Vector Search."""
+    """
+    Perform vector search against MongoDB Atlas Vector Search.
+    Pass query_embedding to reuse an embedding computed in a batch.
+    num_candidates defaults to a multiple of top_k; raise it to trade latency for recall.
+    """
     try:
         db = get_db()
         collection = db[collection_name]
         
         # Generate embedding for query
-        query_embedding = await embed_text(query_text)
+        if query_embedding is None:
+            query_embedding = await embed_text(query_text)
+        
+        # A near-identical recent query against an unchanged collection has the same answer
+        namespace = (collection_name, domain_filter, top_k, num_candidates)
+        epoch = get_write_epoch(collection_name, domain_filter)
+        cached = _query_cache.get(namespace, query_embedding)
+        if cached is not None:
+            expires_at, cached_epoch, cached_results = cached
+            if cached_epoch == epoch and expires_at > time.monotonic():
+                return list(cached_results)
         
         # Build aggregation pipeline with vector search
-        pipeline = [
-            {
-                "$vectorSearch": {
-                    "index": "clause_vector_index" if collection_name == "clause_embeddings" else "campus_resource_index",
-                    "path": "embedding",
-                    "queryVector": query_embedding,
-                    "numCandidates": 100,
-                    "limit": top_k
-                }
-            }
-        ]
+        search = {
+            "index": _VECTOR_INDEXES[collection_name],
+            "path": "embedding",
+            "queryVector": query_embedding,
+            "numCandidates": num_candidates or max(
+                top_k * VECTOR_SEARCH_CANDIDATES_PER_RESULT,
+                VECTOR_SEARCH_MIN_CANDIDATES
+            ),
+            "limit": top_k
+        }
         
-        # Add domain filter if specified
-        if domain_filter:
-            pipeline.append({
-                "$match": {"domain": domain_filter}
-            })
-        
-        # Project relevant fields
-        pipeline.append({
-            "$project": {
-                "clause_text": 1,
-                "resource_name": 1,
-                "description": 1,
-                "url": 1,
-                "domain": 1,
-                "risk_metadata": 1,
-                "score": {"$meta": "vectorSearchScore"}
-            }
-        })
+        # Filter by domain inside the ANN search (indexed as a "filter" field) so the
+        # top_k results all come from that domain instead of being post-filtered away;
+        # an index found without that field falls back to a $match after the search
+        if domain_filter and search["index"] not in _unfiltered_indexes:
+            search["filter"] = {"domain": {"$eq": domain_filter}}
         
-        results = await collection.aggregate(pipeline).to_list(None)
+        try:
+            results = await _run_vector_search(
+                collection,
+                search,
+                top_k,
+                post_filter_domain=None if "filter" in search else domain_filter
+            )
+        except OperationFailure as e:
+            if "filter" not in search or "needs to be indexed" not in str(e):
+                raise
+            _unfiltered_indexes.add(search["index"])
+            logger.warning(
+                "Index %s has no \"domain\" filter field; filtering after the search, which may return fewer than top_k results: %s",
+                search["index"], e
+            )
+            unfiltered = {key: value for key, value in search.items() if key != "filter"}
+            results = await _run_vector_search(collection, unfiltered, top_k, domain_filter)
+        
+        _query_cache.put(
+            namespace,
+            query_embedding,
+            (time.monotonic() + QUERY_CACHE_TTL_SECONDS, epoch, tuple(results))
+        )
         return results
     except Exception as e:
-        logger.error(f"Vector search failed: {e}")
+        logger.error("Vector search failed: %s", e)
         return []
 
 
@@ -82,28 +252,119 @@ async def store_clause_embedding(
     domain: str,
     risk_metadata: Optional[Dict] = None
 ) -> bool:
-    """Store a clause with its embedding."""
+    """
+    Store a clause with its embedding.
+    Clauses are identified by a content hash: a repeat within the same session is
+    not stored again, and an embedding already stored for the same text is reused.
+    """
     try:
         db = get_db()
-        collection = db["clause_embeddings"]
+        # Clause embeddings can be rebuilt from the document, so a primary-only ack is enough
+        collection = db.get_collection("clause_embeddings", write_concern=_CLAUSE_WRITE_CONCERN)
+        
+        key = _embedding_key(clause_text)
+        clause_hash = key.hex()
         
-        embedding = await embed_text(clause_text)
+        embedding = _embedding_cache.get(key)
+        if embedding is None:
+            existing = await collection.find_one({"clause_hash": clause_hash}, {"embedding": 1})
+            if existing:
+                embedding = existing["embedding"]
+                _embedding_cache.put(key, embedding)
+            else:
+                embedding = await embed_text(clause_text)
         
         doc = {
             "session_id": session_id,
             "clause_text": clause_text,
+            "clause_hash": clause_hash,
             "embedding": embedding,
             "domain": domain,
             "risk_metadata": risk_metadata or {}
         }
         
-        result = await collection.insert_one(doc)
-        return result.inserted_id is not None
+        result = await collection.update_one(
+            {"session_id": session_id, "clause_hash": clause_hash},
+            {"$setOnInsert": doc},
+            upsert=True
+        )
+        if result.upserted_id is not None:
+            _bump_write_epoch("clause_embeddings", [domain])
+        return True
     except Exception as e:
-        logger.error(f"Failed to store clause embedding: {e}")
+        logger.error("Failed to store clause embedding: %s", e)
         return False
 
 
+async def store_clause_embeddings(
+    session_id: str,
+    clause_texts: List[str],
+    domain: str,
+    risk_metadata: Optional[List[Dict]] = None
+) -> int:
+    """
+    Store all clauses of a document with their embeddings; returns how many were inserted.
+    Behaves like store_clause_embedding per clause, but looks up stored embeddings
+    with one query, embeds the rest in batched requests and writes in one bulk call.
+    """
+    try:
+        db = get_db()
+        collection = db.get_collection("clause_embeddings", write_concern=_CLAUSE_WRITE_CONCERN)
+        
+        # First occurrence of each clause text wins, as with the per-clause upsert
+        clauses: Dict[str, Tuple[str, Dict]] = {}
+        for i, clause_text in enumerate(clause_texts):
+            clause_hash = _embedding_key(clause_text).hex()
+            if clause_hash not in clauses:
+                clauses[clause_hash] = (clause_text, risk_metadata[i] if risk_metadata else {})
+        if not clauses:
+            return 0
+        
+        embeddings = {
+            clause_hash: _embedding_cache.get(bytes.fromhex(clause_hash))
+            for clause_hash in clauses
+        }
+        missing = [clause_hash for clause_hash, embedding in embeddings.items() if embedding is None]
+        if missing:
+            async for existing in collection.find(
+                {"clause_hash": {"$in": missing}},
+                {"clause_hash": 1, "embedding": 1}
+            ):
+                if embeddings[existing["clause_hash"]] is None:
+                    embeddings[existing["clause_hash"]] = existing["embedding"]
+                    _embedding_cache.put(bytes.fromhex(existing["clause_hash"]), existing["embedding"])
+            
+            missing = [clause_hash for clause_hash in missing if embeddings[clause_hash] is None]
+            if missing:
+                embedded = await embed_texts([clauses[clause_hash][0] for clause_hash in missing])
+                embeddings.update(zip(missing, embedded))
+        
+        result = await collection.bulk_write(
+            [
+                UpdateOne(
+                    {"session_id": session_id, "clause_hash": clause_hash},
+                    {"$setOnInsert": {
+                        "session_id": session_id,
+                        "clause_text": clause_text,
+                        "clause_hash": clause_hash,
+                        "embedding": embeddings[clause_hash],
+                        "domain": domain,
+                        "risk_metadata": metadata
+                    }},
+                    upsert=True
+                )
+                for clause_hash, (clause_text, metadata) in clauses.items()
+            ],
+            ordered=False
+        )
+        if result.upserted_count:
+            _bump_write_epoch("clause_embeddings", [domain])
+        return result.upserted_count
+    except Exception as e:
+        logger.error("Failed to store clause embeddings: %s", e)
+        return 0
+
+
 async def seed_campus_resources():
     """Seed campus resources into the vector store."""
     try:
@@ -155,12 +416,15 @@ async def seed_campus_resources():
             }
         ]
         
-        # Embed and insert
-        for resource in resources:
-            embedding = await embed_text(f"{resource['resource_name']} {resource['description']}")
+        # Embed every resource in one request and insert them together
+        embeddings = await embed_texts(
+            [f"{resource['resource_name']} {resource['description']}" for resource in resources]
+        )
+        for resource, embedding in zip(resources, embeddings):
             resource["embedding"] = embedding
-            await collection.insert_one(resource)
+        await collection.insert_many(resources, ordered=False)
+        _bump_write_epoch("campus_resources_vector", {resource["domain"] for resource in resources})
         
-        logger.info(f"Seeded {len(resources)} campus resources")
+        logger.info("Seeded %s campus resources", len(resources))
     except Exception as e:
-        logger.warning(f"Failed to seed campus resources: {e}")
+        logger.warning("Failed to seed campus resources: %s", e)
@@ -1,9 +1,11 @@
+import asyncio
 import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from db.mongo import connect_to_mongo, disconnect_from_mongo
 from db.vector_store import seed_campus_resources
+from agents.base_agents import warm_query_embeddings
 from routers import upload, analyze, translate, simulate, resources, chat
 
 # Configure logging
@@ -14,6 +16,13 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+async def warm_up():
+    """Seed campus resources and pre-embed fixed queries; both are idempotent and fail soft."""
+    await seed_campus_resources()
+    await warm_query_embeddings()
+    logger.info("Background warm-up complete")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Manage app startup and shutdown."""
@@ -21,16 +30,18 @@ async def lifespan(app: FastAPI):
     logger.info("Starting Navigate413 backend...")
     try:
         await connect_to_mongo()
-        await seed_campus_resources()
+        # Seeding and embedding warm-up run in the background so requests are served immediately
+        app.state.warm_up_task = asyncio.create_task(warm_up())
         logger.info("Application startup complete")
     except Exception as e:
-        logger.error(f"Startup failed: {e}")
+        logger.error("Startup failed: %s", e)
         raise
     
     yield
     
     # Shutdown
     logger.info("Shutting down...")
+    app.state.warm_up_task.cancel()
     await disconnect_from_mongo()
     logger.info("Application shutdown complete")
 
@@ -73,7 +84,7 @@ async def root():
 @app.get("/health")
 async def health():
     """Health check for deployment."""
-    return {"status": "ok"}
+    return {"status": "ok", "warmed_up": app.state.warm_up_task.done()}
 
 
 if __name__ == "__main__":
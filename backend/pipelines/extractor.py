@@ -25,13 +25,13 @@ async def extract_text_from_pdf(file_path: str) -> Optional[str]:
                     text += page_text + "\n"
         
         if len(text.strip()) > 100:
-            logger.info(f"Extracted {len(text)} characters using pdfplumber")
+            logger.info("Extracted %d characters using pdfplumber", len(text))
             return text.strip()
         else:
             logger.info("Text extraction yielded < 100 chars, likely scanned document")
             return None
     except Exception as e:
-        logger.error(f"Error extracting text with pdfplumber: {e}")
+        logger.error("Error extracting text with pdfplumber: %s", e)
         return None
 
 
@@ -50,13 +50,13 @@ async def extract_text_with_ocr(file_path: str) -> Optional[str]:
                 text += page_text + "\n"
         
         if len(text.strip()) > 100:
-            logger.info(f"Extracted {len(text)} characters using OCR")
+            logger.info("Extracted %d characters using OCR", len(text))
             return text.strip()
         else:
             logger.info("OCR extraction yielded < 100 chars")
             return None
     except Exception as e:
-        logger.error(f"Error extracting text with OCR: {e}")
+        logger.error("Error extracting text with OCR: %s", e)
         return None
 
 
@@ -85,9 +85,9 @@ def split_into_clauses(text: str, chunk_size: int = 3) -> List[str]:
             if clause.strip():
                 clauses.append(clause.strip())
         
-        logger.info(f"Split text into {len(clauses)} clauses")
+        logger.info("Split text into %d clauses", len(clauses))
         return clauses
     except Exception as e:
-        logger.error(f"Error splitting into clauses: {e}")
+        logger.error("Error splitting into clauses: %s", e)
         # Fallback: split by newlines
         return [line.strip() for line in text.split('\n') if line.strip()]
@@ -1,4 +1,6 @@
 import logging
+import re
+from collections import Counter
 from typing import Optional
 import google.generativeai as genai
 from config import GEMINI_API_KEY, GEMINI_MODEL
@@ -8,11 +10,77 @@ logger = logging.getLogger(__name__)
 
 # Configure Gemini
 genai.configure(api_key=GEMINI_API_KEY)
+_model = genai.GenerativeModel(GEMINI_MODEL)
+
+_JSON_DECODER = json.JSONDecoder()
+
+# Keyword fallback groups in priority order: group N of the regex maps to _FALLBACK_DOMAINS[N - 1]
+_FALLBACK_DOMAINS = ("finance", "visa", "housing")
+_FALLBACK_KEYWORDS_RE = re.compile(
+    r"(financial|aid|fafsa|loan|tuition|scholarship)"
+    r"|(visa|work authorization|i-20|employment|international)"
+    r"|(lease|housing|tenant|apartment|rent|roommate)",
+    re.IGNORECASE
+)
+
+
+def _classify_by_keywords(text: str) -> str:
+    """Keyword fallback when the model reply is unusable, in a single regex pass."""
+    matched = set()
+    for match in _FALLBACK_KEYWORDS_RE.finditer(text):
+        if match.lastindex == 1:
+            return _FALLBACK_DOMAINS[0]  # Highest priority, no need to keep scanning
+        matched.add(match.lastindex)
+    return _FALLBACK_DOMAINS[min(matched) - 1] if matched else "unknown"
+
+
+# Distinctive per-domain terms counted by the fast pre-classifier; group N maps to _FALLBACK_DOMAINS[N - 1]
+_FAST_KEYWORDS_RE = re.compile(
+    r"\b(?:(tuition|bursar|disbursement|loans?|fafsa|scholarships?)"
+    r"|(I-20|F-1|J-1|SEVIS|immigration|visa)"
+    r"|(lease|tenants?|landlord|rent|premises|sublease))\b",
+    re.IGNORECASE
+)
+_FAST_MIN_HITS = 3
+_FAST_MIN_RATIO = 2
+
+
+def _fast_classify(text: str) -> Optional[str]:
+    """
+    Classify without Gemini when one domain's terms clearly dominate the text:
+    at least _FAST_MIN_HITS hits and _FAST_MIN_RATIO times the runner-up.
+    """
+    counts = Counter(match.lastindex for match in _FAST_KEYWORDS_RE.finditer(text))
+    if not counts:
+        return None
+    
+    ranked = counts.most_common(2)
+    group, hits = ranked[0]
+    runner_up = ranked[1][1] if len(ranked) > 1 else 0
+    if hits >= _FAST_MIN_HITS and hits >= _FAST_MIN_RATIO * runner_up:
+        return _FALLBACK_DOMAINS[group - 1]
+    return None
+
+
+def _extract_json(text: str) -> dict:
+    """Parse the first JSON object in text, ignoring markdown fences or prose around it."""
+    start = text.find("{")
+    if start < 0:
+        return {}
+    try:
+        result, _ = _JSON_DECODER.raw_decode(text, start)
+        return result if isinstance(result, dict) else {}
+    except json.JSONDecodeError:
+        return {}
 
 
 async def classify_document_domain(text: str) -> str:
     """Classify document domain using zero-shot prompting."""
     try:
+        domain = _fast_classify(text[:3000])
+        if domain:
+            return domain
+        
         prompt = f"""Analyze this document and classify its domain. Return ONLY a JSON object.
 
 Document text:
@@ -21,29 +89,21 @@ Document text:
 Respond with ONLY this JSON format (no other text):
 {{"domain": "finance|visa|housing|unknown"}}"""
         
-        model = genai.GenerativeModel(GEMINI_MODEL)
-        response = model.generate_content(prompt)
+        response = await _model.generate_content_async(prompt)
         
         # Parse response
         response_text = response.text.strip()
         
         # Try to extract JSON
-        try:
-            result = json.loads(response_text)
-            domain = result.get("domain", "unknown").lower()
+        result = _extract_json(response_text)
+        if result:
+            domain = str(result.get("domain", "unknown")).lower()
             valid_domains = ["finance", "visa", "housing", "unknown"]
             return domain if domain in valid_domains else "unknown"
-        except json.JSONDecodeError:
-            logger.warning(f"Invalid JSON response: {response_text}")
+        else:
+            logger.warning("Invalid JSON response: %s", response_text)
             # Fallback classification based on keywords
-            text_lower = text.lower()
-            if any(word in text_lower for word in ["financial", "aid", "fafsa", "loan", "tuition", "scholarship"]):
-                return "finance"
-            elif any(word in text_lower for word in ["visa", "work authorization", "i-20", "employment", "international"]):
-                return "visa"
-            elif any(word in text_lower for word in ["lease", "housing", "tenant", "apartment", "rent", "roommate"]):
-                return "housing"
-            return "unknown"
+            return _classify_by_keywords(text)
     except Exception as e:
-        logger.error(f"Error classifying document: {e}")
+        logger.error("Error classifying document: %s", e)
         return "unknown"
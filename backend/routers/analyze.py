@@ -57,17 +57,18 @@ async def analyze_document(request):
         
         # Extract results from agent analysis
         domain = final_state.get("domain", "unknown")
-        risk_assessment = final_state.get("risk_assessment", "")
+        risk_assessment = final_state.get("risk_assessment") or ""
         red_flags_raw = final_state.get("red_flags", [])
         clauses_raw = final_state.get("clauses", [])
         resources_raw = final_state.get("resources", [])
         obligations = final_state.get("obligations", [])
         
         # Extract risk level from assessment text
+        risk_lower = risk_assessment.lower()
         risk_level = "MEDIUM"  # Default
-        if "high" in risk_assessment.lower():
+        if "high" in risk_lower:
             risk_level = "HIGH"
-        elif "low" in risk_assessment.lower():
+        elif "low" in risk_lower:
             risk_level = "LOW"
         
         # Build clause objects
@@ -102,11 +103,11 @@ async def analyze_document(request):
         
         # Extract recommendations from analysis
         recommendations = []
-        if "high" in risk_assessment.lower():
+        if "high" in risk_lower:
             recommendations.append("Seek guidance from relevant campus office before proceeding")
-        if "penalty" in risk_assessment.lower():
+        if "penalty" in risk_lower:
             recommendations.append("Understand all penalties and deadlines clearly")
-        if "compliance" in risk_assessment.lower():
+        if "compliance" in risk_lower:
             recommendations.append("Ensure full compliance with all requirements")
         recommendations.append("Ask questions about any unclear terms")
         
@@ -140,5 +141,5 @@ async def analyze_document(request):
             recommendations=recommendations
         )
     except Exception as e:
-        logger.error(f"Analysis error: {e}")
+        logger.error("Analysis error: %s", e)
         raise
@@ -11,6 +11,7 @@ router = APIRouter(prefix="/api", tags=["chat"])
 
 # Configure Gemini
 genai.configure(api_key=GEMINI_API_KEY)
+_model = genai.GenerativeModel(GEMINI_MODEL)
 
 
 class ChatRequest(BaseModel):
@@ -62,12 +63,11 @@ Provide a helpful, concise response (2-3 sentences) that:
 Response:"""
         
         # Call Gemini
-        model = genai.GenerativeModel(GEMINI_MODEL)
-        response = model.generate_content(prompt)
+        response = await _model.generate_content_async(prompt)
         response_text = response.text.strip()
         
         return ChatResponse(response=response_text)
     
     except Exception as e:
-        logger.error(f"Chat error: {e}")
+        logger.error("Chat error: %s", e)
         return ChatResponse(response="I encountered an error processing your question. Please try again or contact Student Legal Services for assistance.")
@@ -36,7 +36,7 @@ async def get_resources(
         
         return ResourceQueryResponse(results=resources)
     except Exception as e:
-        logger.error(f"Resource search error: {e}")
+        logger.error("Resource search error: %s", e)
         return ResourceQueryResponse(results=[])
 
 
@@ -52,5 +52,5 @@ async def get_session(session_id: str):
         
         return doc
     except Exception as e:
-        logger.error(f"Session retrieval error: {e}")
+        logger.error("Session retrieval error: %s", e)
         raise
@@ -3,7 +3,7 @@ from fastapi import APIRouter
 from models.schemas import ScenarioRequest, ScenarioResponse
 from db.mongo import get_db
 from agents.specialized_agents import scenario_agent
-from agents.base_agents import AgentState
+from agents.base_agents import new_agent_state
 
 logger = logging.getLogger(__name__)
 
@@ -31,23 +31,18 @@ async def simulate_scenario(request: ScenarioRequest):
         analysis = doc["analysis_results"]
         
         # Build state for scenario agent
-        state: AgentState = {
-            "session_id": session_id,
-            "raw_text": "",
-            "domain": analysis.get("domain", "unknown"),
-            "language": "en",
-            "clauses": analysis.get("obligations", []),
-            "obligations": analysis.get("obligations", []),
-            "financial_details": analysis.get("risk_assessment", ""),
-            "housing_details": analysis.get("risk_assessment", ""),
-            "visa_details": analysis.get("risk_assessment", ""),
-            "risk_assessment": analysis.get("risk_assessment", ""),
-            "red_flags": analysis.get("red_flags", []),
-            "resources": [],
-            "translation": None,
-            "scenario": request.scenario_description,
-            "error": None
-        }
+        state = new_agent_state(
+            session_id,
+            domain=analysis.get("domain", "unknown"),
+            clauses=analysis.get("obligations", []),
+            obligations=analysis.get("obligations", []),
+            financial_details=analysis.get("risk_assessment", ""),
+            housing_details=analysis.get("risk_assessment", ""),
+            visa_details=analysis.get("risk_assessment", ""),
+            risk_assessment=analysis.get("risk_assessment", ""),
+            red_flags=analysis.get("red_flags", []),
+            scenario=request.scenario_description
+        )
         
         # Run scenario agent
         state = await scenario_agent(state)
@@ -62,9 +57,10 @@ async def simulate_scenario(request: ScenarioRequest):
         
         lines = scenario_text.split('\n')
         for line in lines:
-            if "impact" in line.lower() or "result" in line.lower():
+            line_lower = line.lower()
+            if "impact" in line_lower or "result" in line_lower:
                 implications.append(line.strip())
-            if "should" in line.lower() or "recommend" in line.lower():
+            if "should" in line_lower or "recommend" in line_lower:
                 suggested_steps.append(line.strip())
         
         return ScenarioResponse(
@@ -78,5 +74,5 @@ async def simulate_scenario(request: ScenarioRequest):
             ]
         )
     except Exception as e:
-        logger.error(f"Simulation error: {e}")
+        logger.error("Simulation error: %s", e)
         raise
@@ -3,7 +3,7 @@ from fastapi import APIRouter
 from models.schemas import TranslateRequest, TranslateResponse
 from db.mongo import get_db
 from agents.specialized_agents import translation_agent
-from agents.base_agents import AgentState
+from agents.base_agents import new_agent_state
 
 logger = logging.getLogger(__name__)
 
@@ -29,18 +29,11 @@ async def translate_summary(request: TranslateRequest):
         analysis = doc["analysis_results"]
         
         # Build state for translation agent
-        state: AgentState = {
-            "session_id": session_id,
-            "raw_text": "",
-            "domain": analysis.get("domain", "unknown"),
-            "language": request.target_language,
-            "clauses": [],
-            "risk_output": analysis.get("risk_output", {}),
-            "resources": [],
-            "translation": None,
-            "scenario": None,
-            "error": None
-        }
+        state = new_agent_state(
+            session_id,
+            domain=analysis.get("domain", "unknown"),
+            language=request.target_language
+        )
         
         # Run translation agent
         state = await translation_agent(state)
@@ -51,5 +44,5 @@ async def translate_summary(request: TranslateRequest):
             context_note="Student-friendly institutional explanation translated from English."
         )
     except Exception as e:
-        logger.error(f"Translation error: {e}")
+        logger.error("Translation error: %s", e)
         raise
@@ -1,11 +1,11 @@
 import logging
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
 from fastapi import APIRouter, UploadFile, File, BackgroundTasks
 from models.schemas import UploadResponse
 from db.mongo import get_db
 from pipelines.extractor import extract_text_from_document, split_into_clauses
-from db.vector_store import store_clause_embedding
+from db.vector_store import store_clause_embeddings
 from config import TEMP_FILE_DIR
 import os
 
@@ -32,21 +32,19 @@ async def process_file_background(
                 {"_id": session_id},
                 {"$set": {"processed_flag": False, "error": "text_extraction_failed"}}
             )
-            logger.error(f"Text extraction failed for session {session_id}")
+            logger.error("Text extraction failed for session %s", session_id)
             return
         
         # Split into clauses
         clauses = split_into_clauses(text)
         
-        # Store clauses with embeddings
-        for i, clause in enumerate(clauses):
-            clause_id = f"{session_id}_c{i}"
-            await store_clause_embedding(
-                session_id=session_id,
-                clause_text=clause,
-                domain="unknown",
-                risk_metadata={"clause_index": i}
-            )
+        # Store clauses with embeddings, embedded in batches and written in one bulk call
+        await store_clause_embeddings(
+            session_id=session_id,
+            clause_texts=clauses,
+            domain="unknown",
+            risk_metadata=[{"clause_index": i} for i in range(len(clauses))]
+        )
         
         # Update document metadata
         await db["documents_metadata"].update_one(
@@ -56,15 +54,15 @@ async def process_file_background(
                     "processed_flag": True,
                     "raw_text": text,
                     "clause_count": len(clauses),
-                    "processed_timestamp": datetime.utcnow()
+                    "processed_timestamp": datetime.now(timezone.utc)
                 }
             }
         )
         
-        logger.info(f"Document processing completed for session {session_id}")
+        logger.info("Document processing completed for session %s", session_id)
         
     except Exception as e:
-        logger.error(f"Background processing error: {e}")
+        logger.error("Background processing error: %s", e)
         db = get_db()
         await db["documents_metadata"].update_one(
             {"_id": session_id},
@@ -76,7 +74,7 @@ async def process_file_background(
             if os.path.exists(file_path):
                 os.remove(file_path)
         except Exception as e:
-            logger.warning(f"Failed to clean up temp file: {e}")
+            logger.warning("Failed to clean up temp file: %s", e)
 
 
 @router.post("/upload", response_model=UploadResponse)
@@ -95,17 +93,18 @@ async def upload_document(file: UploadFile = File(...), background_tasks: Backgr
             f.write(content)
         
         # Create document metadata
+        upload_timestamp = datetime.now(timezone.utc)
         doc_metadata = {
             "_id": session_id,
             "user_session_id": session_id,
             "file_name": file.filename,
             "storage_url": f"local://{file_path}",
-            "upload_timestamp": datetime.utcnow(),
+            "upload_timestamp": upload_timestamp,
             "processed_flag": False
         }
         
         await db["documents_metadata"].insert_one(doc_metadata)
-        logger.info(f"Document uploaded: {session_id}")
+        logger.info("Document uploaded: %s", session_id)
         
         # Queue background processing
         if background_tasks:
@@ -120,9 +119,9 @@ async def upload_document(file: UploadFile = File(...), background_tasks: Backgr
             session_id=session_id,
             file_name=file.filename,
             status="processing",
-            upload_timestamp=datetime.utcnow()
+            upload_timestamp=upload_timestamp
         )
     
     except Exception as e:
-        logger.error(f"Upload failed: {e}")
+        logger.error("Upload failed: %s", e)
         raise
@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from agents import base_agents
+
+# One unit vector per domain seed, in _ROUTER_SEEDS order (finance, housing, visa)
+SEED_EMBEDDINGS = [
+    [1.0, 0.0, 0.0, 0.0],
+    [0.0, 1.0, 0.0, 0.0],
+    [0.0, 0.0, 1.0, 0.0],
+]
+
+
+@pytest.fixture
+def route(monkeypatch):
+    async def fixed_query_embeddings(queries):
+        assert queries == list(base_agents._ROUTER_SEEDS.values())
+        return SEED_EMBEDDINGS
+    
+    monkeypatch.setattr(base_agents, "_fixed_query_embeddings", fixed_query_embeddings)
+    
+    def run(document_embedding):
+        async def embed_text(text):
+            return document_embedding
+        
+        monkeypatch.setattr(base_agents, "embed_text", embed_text)
+        return asyncio.run(base_agents._embedding_domain("document text"))
+    
+    return run
+
+
+def test_clear_match_is_accepted(route):
+    # Cosine 0.99 to housing, 0.11 to the runner-up
+    assert route([0.1, 0.9, 0.1, 0.0]) == "housing"
+
+
+def test_weak_best_match_is_left_to_gemini(route):
+    # Cosine 0.60 to finance: well ahead of the others but not similar enough
+    assert route([0.6, 0.1, 0.0, 0.8]) is None
+
+
+def test_close_runner_up_is_left_to_gemini(route):
+    # Cosine 0.73 to finance but only 0.05 ahead of housing
+    assert route([0.7, 0.65, 0.0, 0.0]) is None
+
+
+def test_missing_seed_embedding_is_left_to_gemini(route, monkeypatch):
+    async def fixed_query_embeddings(queries):
+        return [SEED_EMBEDDINGS[0], None, SEED_EMBEDDINGS[2]]
+    
+    monkeypatch.setattr(base_agents, "_fixed_query_embeddings", fixed_query_embeddings)
+    
+    assert route([1.0, 0.0, 0.0, 0.0]) is None
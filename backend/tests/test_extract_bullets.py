@@ -0,0 +1,56 @@
+from agents.base_agents import _extract_bullets
+
+
+def test_bulleted_items():
+    text = (
+        "- Tuition of $5,000 is due on August 15\n"
+        "* Late payments incur a $100 fee\n"
+        "• Refunds end after the second week\n"
+        "- short\n"
+    )
+    
+    assert _extract_bullets(text, 10) == [
+        "Tuition of $5,000 is due on August 15",
+        "Late payments incur a $100 fee",
+        "Refunds end after the second week",
+    ]
+
+
+def test_numbered_items_and_limit():
+    text = (
+        "1. Maintain full-time enrollment every term\n"
+        "2) Report address changes within 10 days\n"
+        "3. Keep health insurance active all year\n"
+    )
+    
+    assert _extract_bullets(text, 2) == [
+        "Maintain full-time enrollment every term",
+        "Report address changes within 10 days",
+    ]
+
+
+def test_heading_lines_are_skipped():
+    text = (
+        "Key financial obligations:\n"
+        "- Payment deadlines and penalties:\n"
+        "- Pay the housing deposit by June 1\n"
+    )
+    
+    assert _extract_bullets(text, 10) == ["Pay the housing deposit by June 1"]
+
+
+def test_prose_reply_falls_back_to_substantive_lines():
+    text = (
+        "## Financial summary\n"
+        "**Payment terms and deadlines:**\n"
+        "The award covers tuition but not the $800 housing deposit.\n"
+        "\n"
+        "You must repay the loan within six months of graduating.\n"
+        "Short line here.\n"
+    )
+    
+    assert _extract_bullets(text, 10) == [
+        "The award covers tuition but not the $800 housing deposit.",
+        "You must repay the loan within six months of graduating.",
+    ]
+    assert _extract_bullets(text, 1) == ["The award covers tuition but not the $800 housing deposit."]
@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from agents import base_agents
+
+
+class FakeGemini:
+    """Stands in for base_agents._generate; answers batched prompts with well-formed task markers."""
+    
+    def __init__(self):
+        self.calls = []
+        self.batch_reply = None
+    
+    async def generate(self, prompt, temperature, max_tokens=None):
+        self.calls.append((prompt, temperature, max_tokens))
+        parts = base_agents._TASK_MARKER_RE.split(prompt)
+        if len(parts) == 1:
+            return f"answer to {prompt}"
+        if self.batch_reply is not None:
+            return self.batch_reply
+        return "\n".join(
+            f"### TASK {number}\nanswer to {body.strip()}"
+            for number, body in zip(parts[1::2], parts[2::2])
+        )
+    
+    def batched_calls(self):
+        return [call for call in self.calls if "### TASK 1" in call[0]]
+    
+    def single_calls(self):
+        return [call for call in self.calls if "### TASK 1" not in call[0]]
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    fake = FakeGemini()
+    monkeypatch.setattr(base_agents, "_generate", fake.generate)
+    base_agents._prompt_cache.clear()
+    yield fake
+    base_agents._prompt_cache.clear()
+
+
+def test_batches_only_prompts_at_the_same_temperature(gemini):
+    answers = asyncio.run(base_agents.call_gemini_batch(
+        [("finance", 0.7), ("housing", 0.7), ("visa", 0.5)],
+        cache_namespaces=["finance", "housing", "visa"],
+        max_tokens=[768, 1024, 768]
+    ))
+    
+    assert answers == ["answer to finance", "answer to housing", "answer to visa"]
+    
+    batched = gemini.batched_calls()
+    assert len(batched) == 1
+    prompt, temperature, max_tokens = batched[0]
+    assert temperature == 0.7
+    assert "finance" in prompt and "housing" in prompt and "visa" not in prompt
+    assert max_tokens == 768 + 1024 + 2 * base_agents._BATCH_MARKER_TOKENS
+    
+    assert gemini.single_calls() == [("visa", 0.5, 768)]
+    
+    # Each answer is cached under the temperature it was generated at
+    assert base_agents._lookup_cached_response("visa", 0.5, "visa") == "answer to visa"
+    assert base_agents._lookup_cached_response("finance", 0.7, "finance") == "answer to finance"
+
+
+def test_cached_prompts_are_left_out_of_the_batch(gemini):
+    base_agents._store_cached_response("finance", "finance", 0.7, "cached finance")
+    
+    answers = asyncio.run(base_agents.call_gemini_batch(
+        [("finance", 0.7), ("housing", 0.7)],
+        cache_namespaces=["finance", "housing"]
+    ))
+    
+    assert answers == ["cached finance", "answer to housing"]
+    assert gemini.calls == [("housing", 0.7, None)]
+
+
+@pytest.mark.parametrize("reply", [
+    "### TASK 1\nfirst answer\n",  # second marker missing
+    "### TASK 2\nsecond answer\n### TASK 1\nfirst answer\n",  # markers out of order
+    "### TASK 1\n\n### TASK 2\nsecond answer\n",  # empty section
+    "### TASK 1\nfirst answer\n### TASK 2\nsecond answer\n### TASK 3\nextra answer\n",  # count mismatch
+    "first answer\n\nsecond answer",  # no markers at all
+])
+def test_unsplittable_reply_falls_back_to_single_calls(gemini, reply):
+    gemini.batch_reply = reply
+    
+    answers = asyncio.run(base_agents.call_gemini_batch([("finance", 0.7), ("housing", 0.7)]))
+    
+    assert answers == ["answer to finance", "answer to housing"]
+    assert len(gemini.batched_calls()) == 1
+    assert sorted(gemini.single_calls()) == [("finance", 0.7, None), ("housing", 0.7, None)]
+
+
+def test_prompt_alone_at_its_temperature_is_sent_without_batch_markers(gemini):
+    answers = asyncio.run(base_agents.call_gemini_batch([("visa", 0.5)], max_tokens=[768]))
+    
+    assert answers == ["answer to visa"]
+    assert gemini.calls == [("visa", 0.5, 768)]
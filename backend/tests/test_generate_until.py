@@ -0,0 +1,71 @@
+import asyncio
+import re
+from types import SimpleNamespace
+
+import pytest
+
+from agents import base_agents
+
+
+class FakeStream:
+    """Streamed Gemini response that records which chunks were pulled and whether it was cancelled."""
+    
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.pulled = []
+        self.cancelled = False
+    
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            try:
+                # Stands in for waiting on the network for the next chunk
+                await asyncio.sleep(0)
+            except asyncio.CancelledError:
+                self.cancelled = True
+                raise
+            self.pulled.append(chunk)
+            yield SimpleNamespace(text=chunk)
+
+
+class FakeModel:
+    def __init__(self, stream):
+        self.stream = stream
+    
+    async def generate_content_async(self, prompt, stream=False):
+        assert stream
+        return self.stream
+
+
+@pytest.fixture
+def stream(monkeypatch):
+    fake = FakeStream(["Domain: ", "housing\n", "Reasoning: ", "the lease ", "mentions rent"])
+    monkeypatch.setattr(base_agents, "_get_model", lambda *args: FakeModel(fake))
+    return fake
+
+
+def test_stops_pulling_chunks_once_the_pattern_matches(stream):
+    text = asyncio.run(base_agents._generate_until("prompt", 0.3, re.compile(r"Domain:\s*\w+\n")))
+    
+    assert text == "Domain: housing"
+    assert stream.pulled == ["Domain: ", "housing\n"]
+    assert stream.cancelled
+
+
+def test_returns_the_whole_response_without_a_match(stream):
+    text = asyncio.run(base_agents._generate_until("prompt", 0.3, re.compile(r"Visa:")))
+    
+    assert text == "Domain: housing\nReasoning: the lease mentions rent"
+    assert stream.pulled == stream.chunks
+    assert not stream.cancelled
+
+
+def test_stream_errors_are_raised(monkeypatch):
+    class BrokenStream(FakeStream):
+        async def __aiter__(self):
+            yield SimpleNamespace(text="Domain: ")
+            raise RuntimeError("stream reset")
+    
+    monkeypatch.setattr(base_agents, "_get_model", lambda *args: FakeModel(BrokenStream([])))
+    
+    with pytest.raises(RuntimeError, match="stream reset"):
+        asyncio.run(base_agents._generate_until("prompt", 0.3, re.compile(r"Visa:")))
@@ -0,0 +1,32 @@
+from tools.semantic_cache import SemanticCache
+
+
+def test_get_returns_value_above_threshold():
+    cache = SemanticCache(threshold=0.95)
+    cache.put("ns", [1.0, 0.0], "value")
+    
+    assert cache.get("ns", [1.0, 0.01]) == "value"
+    assert cache.get("ns", [0.0, 1.0]) is None
+    assert cache.get("other", [1.0, 0.0]) is None
+
+
+def test_put_replaces_near_duplicate_entry():
+    cache = SemanticCache(threshold=0.95)
+    cache.put("ns", [1.0, 0.0], "stale")
+    cache.put("ns", [1.0, 0.0], "fresh")
+    
+    assert cache.get("ns", [1.0, 0.0]) == "fresh"
+    vectors, values = cache._buckets["ns"]
+    assert values == ["fresh"]
+    assert len(vectors) == 1
+
+
+def test_put_keeps_distinct_entries_and_evicts_oldest():
+    cache = SemanticCache(threshold=0.95, max_entries=2)
+    cache.put("ns", [1.0, 0.0, 0.0], "a")
+    cache.put("ns", [0.0, 1.0, 0.0], "b")
+    cache.put("ns", [0.0, 0.0, 1.0], "c")
+    
+    assert cache.get("ns", [1.0, 0.0, 0.0]) is None
+    assert cache.get("ns", [0.0, 1.0, 0.0]) == "b"
+    assert cache.get("ns", [0.0, 0.0, 1.0]) == "c"
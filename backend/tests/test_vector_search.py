@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+from pymongo.errors import OperationFailure
+
+from db import vector_store
+
+
+class FakeCursor:
+    def __init__(self, results):
+        self.results = results
+    
+    async def to_list(self, length):
+        return self.results[:length]
+
+
+class FakeCollection:
+    """Records aggregate pipelines; rejects $vectorSearch filters like an index without a filter field."""
+    
+    def __init__(self, results, filter_indexed=True):
+        self.results = results
+        self.filter_indexed = filter_indexed
+        self.pipelines = []
+    
+    def aggregate(self, pipeline):
+        self.pipelines.append(pipeline)
+        if "filter" in pipeline[0]["$vectorSearch"] and not self.filter_indexed:
+            raise OperationFailure("PlanExecutor error during aggregation :: caused by :: Path 'domain' needs to be indexed as token")
+        return FakeCursor(self.results)
+
+
+@pytest.fixture
+def collection(monkeypatch):
+    fake = FakeCollection([{"clause_text": "Rent is due on the 1st", "domain": "housing"}])
+    monkeypatch.setattr(vector_store, "get_db", lambda: {"clause_embeddings": fake})
+    vector_store._query_cache.clear()
+    vector_store._unfiltered_indexes.clear()
+    yield fake
+    vector_store._query_cache.clear()
+    vector_store._unfiltered_indexes.clear()
+
+
+def search(domain_filter="housing"):
+    return asyncio.run(vector_store.vector_search(
+        "rent due date",
+        domain_filter=domain_filter,
+        query_embedding=[1.0, 0.0, 0.0]
+    ))
+
+
+def test_domain_filter_runs_inside_vector_search(collection):
+    assert search() == collection.results
+    
+    pipeline, = collection.pipelines
+    assert pipeline[0]["$vectorSearch"]["filter"] == {"domain": {"$eq": "housing"}}
+    assert not any("$match" in stage for stage in pipeline)
+
+
+def test_index_without_filter_field_falls_back_to_match(collection):
+    collection.filter_indexed = False
+    
+    assert search() == collection.results
+    
+    rejected, fallback = collection.pipelines
+    assert "filter" in rejected[0]["$vectorSearch"]
+    assert "filter" not in fallback[0]["$vectorSearch"]
+    assert fallback[1] == {"$match": {"domain": "housing"}}
+    
+    # Later searches on that index go straight to the $match
+    collection.pipelines.clear()
+    vector_store._query_cache.clear()
+    assert search() == collection.results
+    pipeline, = collection.pipelines
+    assert pipeline[1] == {"$match": {"domain": "housing"}}
+
+
+def test_other_search_errors_return_no_results(collection, monkeypatch):
+    def aggregate(pipeline):
+        raise OperationFailure("index not found")
+    
+    monkeypatch.setattr(collection, "aggregate", aggregate)
+    
+    assert search() == []
+    assert not vector_store._unfiltered_indexes
@@ -1,6 +1,7 @@
+import asyncio
 import logging
 from typing import Optional, List, Dict, Any
-from db.vector_store import vector_search
+from db.vector_store import vector_search, embed_texts
 
 logger = logging.getLogger(__name__)
 
@@ -10,7 +11,8 @@ async def GlobalRetrievalTool(
     domain_filter: Optional[str] = None,
     campus: str = "UMass",
     top_k: int = 3,
-    collection_type: str = "clause"  # "clause" or "resource"
+    collection_type: str = "clause",  # "clause" or "resource"
+    query_embedding: Optional[List[float]] = None
 ) -> List[Dict[str, Any]]:
     """
     Universal retrieval tool for semantic search.
@@ -22,6 +24,7 @@ async def GlobalRetrievalTool(
         campus: Campus name (default: UMass)
         top_k: Number of results to return
         collection_type: Type of collection to search ("clause" or "resource")
+        query_embedding: Precomputed embedding of query_text, skips embedding it again
     
     Returns:
         List of relevant documents with scores
@@ -33,11 +36,89 @@ async def GlobalRetrievalTool(
             query_text=query_text,
             domain_filter=domain_filter,
             top_k=top_k,
-            collection_name=collection_name
+            collection_name=collection_name,
+            query_embedding=query_embedding
         )
         
-        logger.info(f"GlobalRetrievalTool returned {len(results)} results for query")
+        logger.debug("GlobalRetrievalTool returned %d results for query: %s", len(results), query_text)
         return results
     except Exception as e:
-        logger.error(f"GlobalRetrievalTool error: {e}")
+        logger.error("GlobalRetrievalTool error: %s", e)
         return []
+
+
+async def GlobalRetrievalToolBatch(
+    query_texts: List[str],
+    domain_filters: Optional[List[Optional[str]]] = None,
+    top_k: int = 3,
+    collection_type: str = "clause",
+    query_embeddings: Optional[List[Optional[List[float]]]] = None
+) -> List[List[Dict[str, Any]]]:
+    """
+    Run several searches with at most one embedding round-trip.
+    Queries without a precomputed embedding are embedded together and
+    the vector searches then run concurrently.
+    
+    Args:
+        query_texts: The semantic queries
+        domain_filters: Optional per-query domain filters
+        top_k: Number of results to return per query
+        collection_type: Type of collection to search ("clause" or "resource")
+        query_embeddings: Optional per-query precomputed embeddings (None entries are embedded)
+    
+    Returns:
+        One result list per query, in query order
+    """
+    try:
+        collection_name = "clause_embeddings" if collection_type == "clause" else "campus_resources_vector"
+        domain_filters = domain_filters or [None] * len(query_texts)
+        
+        embeddings = list(query_embeddings or [None] * len(query_texts))
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            for i, embedding in zip(missing, await embed_texts([query_texts[i] for i in missing])):
+                embeddings[i] = embedding
+        
+        results = await asyncio.gather(*(
+            vector_search(
+                query_text=query,
+                domain_filter=domain,
+                top_k=top_k,
+                collection_name=collection_name,
+                query_embedding=embedding
+            )
+            for query, domain, embedding in zip(query_texts, domain_filters, embeddings)
+        ))
+        
+        logger.debug("GlobalRetrievalToolBatch returned %d results for %d queries", sum(map(len, results)), len(query_texts))
+        return list(results)
+    except Exception as e:
+        logger.error("GlobalRetrievalToolBatch error: %s", e)
+        return [[] for _ in query_texts]
+
+
+async def GlobalRetrievalToolMulti(
+    queries: List[Dict[str, Any]],
+    top_k: int = 3,
+    collection_type: str = "clause"
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Run several domain-filtered searches with a single embedding round-trip.
+    
+    Args:
+        queries: List of {"query": str, "domain": str} entries, optionally
+            with a precomputed "embedding"
+        top_k: Number of results to return per query
+        collection_type: Type of collection to search ("clause" or "resource")
+    
+    Returns:
+        Results bucketed by each entry's domain
+    """
+    results = await GlobalRetrievalToolBatch(
+        [q["query"] for q in queries],
+        domain_filters=[q["domain"] for q in queries],
+        top_k=top_k,
+        collection_type=collection_type,
+        query_embeddings=[q.get("embedding") for q in queries]
+    )
+    return {q["domain"]: found for q, found in zip(queries, results)}
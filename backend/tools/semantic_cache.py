@@ -0,0 +1,62 @@
+import logging
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticCache:
+    """
+    In-process cache keyed by embedding similarity.
+    Entries are bucketed by namespace so a value is only ever served to
+    callers of the same kind (e.g. the same agent at the same temperature).
+    """
+
+    def __init__(self, threshold: float, max_entries: int = 256):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._buckets: Dict[Hashable, Tuple[List[np.ndarray], List[Any]]] = {}
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, namespace: Hashable, embedding: List[float]) -> Optional[Any]:
+        """Return the closest cached value if its cosine similarity clears the threshold."""
+        bucket = self._buckets.get(namespace)
+        if not bucket:
+            return None
+
+        vectors, values = bucket
+        scores = np.stack(vectors) @ self._normalize(embedding)
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+
+        logger.debug("Semantic cache hit in %s (similarity=%.3f)", namespace, scores[best])
+        return values[best]
+
+    def put(self, namespace: Hashable, embedding: List[float], value: Any) -> None:
+        """
+        Store a value, evicting the oldest entry once the namespace is full.
+        An existing entry that get() would match for this embedding is replaced,
+        so a fresh value is never shadowed by an older near-duplicate.
+        """
+        vectors, values = self._buckets.setdefault(namespace, ([], []))
+        vector = self._normalize(embedding)
+        if vectors:
+            scores = np.stack(vectors) @ vector
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                del vectors[best]
+                del values[best]
+        vectors.append(vector)
+        values.append(value)
+        if len(values) > self.max_entries:
+            del vectors[0]
+            del values[0]
+
+    def clear(self) -> None:
+        self._buckets.clear()